@@ -0,0 +1,51 @@
+# Shows that a transpiled first-match search stops at the match instead of scanning everything.
+# Run from the repository root: python benchmarks/bench_break.py
+import time
+
+from exprify import transpile_script_source
+
+SIZE = 1_000_000
+
+SCRIPT = """
+def search(items, target):
+    found = -1
+    for i, item in enumerate(items):
+        if item == target:
+            found = i
+            break
+    return found
+
+
+def search_without_break(items, target):
+    found = -1
+    for i, item in enumerate(items):
+        if found == -1 and item == target:
+            found = i
+    return found
+"""
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    namespace, reference = {}, {}
+    exec(transpile_script_source(SCRIPT), namespace)
+    exec(SCRIPT, reference)
+    items = list(range(SIZE))
+    for position in (10, 1_000, 100_000, SIZE - 1):
+        found, elapsed = timed(namespace["search"], items, position)
+        assert found == position
+        _, full = timed(namespace["search_without_break"], items, position)
+        _, plain = timed(reference["search"], items, position)
+        print(
+            f"match at {position:>7}: break {elapsed * 1000:9.3f}ms, "
+            f"full scan {full * 1000:9.3f}ms, untranspiled {plain * 1000:9.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# Compares compiling a transpiled AST directly against emitting it as source and compiling that.
+# Run from the repository root: python benchmarks/bench_compile.py
+import time
+from pathlib import Path
+
+from exprify.emitter import emit_source
+from exprify.transpile import transpile
+
+ROOT = Path(__file__).parent.parent / "test"
+SCRIPTS = ["zipy.py", "rijndael.py"]
+
+
+def best_of(func, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    for name in SCRIPTS:
+        script = (ROOT / "test_scripts" / name).read_text()
+        for factor in (1, 10, 100):
+            source = script * factor
+            through_source = best_of(
+                lambda: compile(emit_source(transpile(source)), name, "exec")
+            )
+            direct = best_of(lambda: compile(transpile(source), name, "exec"))
+            print(
+                f"{factor:>4}x {name:<12} emit and compile {through_source * 1000:8.1f}ms | "
+                f"compile AST {direct * 1000:8.1f}ms ({through_source / direct:.2f}x faster)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# Compares emit_source against ast.unparse on transpiled scripts of growing size.
+# Run from the repository root: python benchmarks/bench_emit.py
+import ast
+import time
+from pathlib import Path
+
+from exprify.emitter import emit_source
+from exprify.transpile import transpile
+
+ROOT = Path(__file__).parent.parent / "test"
+SCRIPTS = ["zipy.py", "rijndael.py"]
+
+
+def best_of(func, tree, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = func(tree)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main():
+    for name in SCRIPTS:
+        script = (ROOT / "test_scripts" / name).read_text()
+        for factor in (1, 10, 100):
+            tree = transpile(script * factor)
+            unparse_time, unparsed = best_of(ast.unparse, tree)
+            emit_time, emitted = best_of(emit_source, tree)
+            print(
+                f"{factor:>4}x {name:<12} ast.unparse {unparse_time * 1000:8.1f}ms "
+                f"{len(unparsed):>8} chars | emit_source {emit_time * 1000:8.1f}ms "
+                f"{len(emitted):>8} chars ({unparse_time / emit_time:.2f}x faster, "
+                f"{len(emitted) / len(unparsed):.0%} of the size)"
+            )
+
+
+if __name__ == "__main__":
+    main()
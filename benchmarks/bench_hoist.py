@@ -0,0 +1,49 @@
+# Times a loop of a million iterations with a try in its body, transpiled with and without
+# hoist_loop_try, which builds the try's handlers and iEH once before the loop.
+# Run from the repository root: python benchmarks/bench_hoist.py
+import time
+
+from exprify import TranspileOptions, transpile_script_source
+
+ITERATIONS = 1_000_000
+
+SCRIPT = """
+def sum_valid(values):
+    total = 0
+    for value in values:
+        try:
+            total = total + value
+        except TypeError:
+            total = total - 1
+    return total
+"""
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    # Every hundredth value raises
+    values = [None if i % 100 == 0 else i for i in range(ITERATIONS)]
+    reference = {}
+    exec(SCRIPT, reference)
+    expected, original = timed(reference["sum_valid"], values)
+    print(f"{'original':<16} {original * 1000:8.1f}ms")
+    for name, options in [
+        ("transpiled", TranspileOptions()),
+        ("hoist_loop_try", TranspileOptions(hoist_loop_try=True)),
+    ]:
+        namespace = {}
+        exec(transpile_script_source(SCRIPT, options), namespace)
+        result, elapsed = timed(namespace["sum_valid"], values)
+        assert result == expected, (result, expected)
+        print(
+            f"{name:<16} {elapsed * 1000:8.1f}ms ({elapsed / ITERATIONS * 1e6:.2f}us per iteration)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# Shows how long `import exprify` takes, and fails if it pulls in modules that should only be
+# imported once they are used.
+# Run from the repository root: python benchmarks/bench_import.py
+import statistics
+import subprocess
+import sys
+
+RUNS = 10
+# Only needed for reflowing, the disk cache, or transpiling function objects
+DEFERRED = (
+    "python_minifier",
+    "importlib.metadata",
+    "concurrent.futures.process",
+    "hashlib",
+    "pickle",
+    "tempfile",
+)
+
+
+def import_times(module):
+    # python -X importtime writes "import time: self | cumulative | name" lines to stderr, in
+    # microseconds. The first run fills the bytecode cache, so it isn't measured.
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    times = {}
+    for line in out.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    import_times("exprify")
+    runs = [import_times("exprify") for _ in range(RUNS)]
+    total = statistics.median(times["exprify"] for times in runs)
+    print(f"import exprify: {total / 1000:.1f}ms (median of {RUNS})")
+    imported = [name for name in DEFERRED if name in runs[0]]
+    if imported:
+        sys.exit(f"imported eagerly: {', '.join(imported)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Compares importing a package normally with importing it through the exprify import hook, both
+# before and after the hook's .pyc cache is written.
+# Run from the repository root: python benchmarks/bench_import_hook.py
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+MODULES = 20
+RUNS = 10
+# Modules only define functions, so importing them is mostly loading their code
+MODULE = """
+import math
+
+
+def search(items, target):
+    found = -1
+    for i, item in enumerate(items):
+        if item == target:
+            found = i
+            break
+    return found
+
+
+def parse(values):
+    total = 0
+    for value in values:
+        try:
+            total += int(value)
+        except ValueError:
+            total += 1
+    return total
+
+
+class Shape:
+    def __init__(self, sides):
+        self.sides = sides
+
+    def angle(self):
+        return math.pi * (self.sides - 2) / self.sides
+
+
+def collatz(n):
+    steps = 0
+    while n != 1:
+        n = n // 2 if n % 2 == 0 else 3 * n + 1
+        steps += 1
+    return steps
+"""
+
+MEASURE = """
+import sys, time
+import exprify
+if sys.argv[1] == "1":
+    exprify.install_import_hook("bench_pkg")
+start = time.perf_counter()
+import bench_pkg
+print(time.perf_counter() - start)
+"""
+
+
+def measure(root, hooked):
+    env = dict(os.environ, PYTHONPATH=str(root))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    out = subprocess.run(
+        [sys.executable, "-c", MEASURE, "1" if hooked else "0"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    ).stdout
+    return float(out)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        pkg = Path(root) / "bench_pkg"
+        pkg.mkdir()
+        names = [f"module{i}" for i in range(MODULES)]
+        for name in names:
+            (pkg / f"{name}.py").write_text(MODULE)
+        (pkg / "__init__.py").write_text(
+            "".join(f"from . import {name}\n" for name in names)
+        )
+        for hooked in (False, True):
+            shutil.rmtree(pkg / "__pycache__", ignore_errors=True)
+            cold = measure(root, hooked)
+            warm = statistics.median(measure(root, hooked) for _ in range(RUNS))
+            mode = "exprify import hook" if hooked else "normal import"
+            print(
+                f"{mode:<20} cold {cold * 1000:8.2f}ms, warm {warm * 1000:8.2f}ms "
+                f"({len(names)} modules)"
+            )
+
+
+if __name__ == "__main__":
+    main()
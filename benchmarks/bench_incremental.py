@@ -0,0 +1,59 @@
+# Compares transpiling a large script from scratch with transpiling it incrementally after one of its
+# functions was edited, which is what every save costs in watch mode.
+# Run from the repository root: python benchmarks/bench_incremental.py
+import os
+import time
+
+from exprify.cache import CACHE_DISABLE_ENV
+from exprify.incremental import IncrementalTranspiler
+from exprify.transpile import transpile_script_source
+
+RUNS = 5
+FUNCTION = """
+def search{i}(items, target):
+    found = -1
+    for i, item in enumerate(items):
+        if item == target + {i}:
+            found = i
+            break
+    return found
+
+
+def parse{i}(values):
+    total = 0
+    for value in values:
+        total += int(value) * {i}
+    return total
+"""
+
+
+def median_of(func):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    # Otherwise the full transpile is only read back from the on-disk cache
+    os.environ[CACHE_DISABLE_ENV] = "1"
+    for count in (50, 200, 800):
+        script = "".join(FUNCTION.format(i=i) for i in range(count))
+        edits = iter(
+            script.replace("* 0\n", f"* {-n}\n") for n in range(1, RUNS * 2 + 1)
+        )
+        full = median_of(lambda: transpile_script_source(script))
+        transpiler = IncrementalTranspiler()
+        transpiler.transpile(script)
+        incremental = median_of(lambda: transpiler.transpile(next(edits)))
+        print(
+            f"{count * 2:>5} functions: full {full * 1000:8.1f}ms | "
+            f"after one edit {incremental * 1000:8.1f}ms "
+            f"({transpiler.last_lowered} lowered, {full / incremental:.1f}x faster)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Shows peak memory of transpiled loops with and without constant_memory_loops.
+# Run from the repository root: python benchmarks/bench_loops.py
+import subprocess
+import sys
+
+SCRIPT = """
+n = 0
+for i in range({iterations}):
+    n += i
+while n > 0:
+    n -= {iterations}
+"""
+
+MEASURE = """
+import resource, sys, tracemalloc
+from exprify import transpile_script_source, TranspileOptions
+options = TranspileOptions(constant_memory_loops=sys.argv[2] == "1")
+code = compile(transpile_script_source(sys.argv[1], options), "<bench>", "exec")
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+tracemalloc.start()
+exec(code, {})
+peak = tracemalloc.get_traced_memory()[1]
+tracemalloc.stop()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+print(peak, rss)
+"""
+
+
+def measure(iterations, constant_memory):
+    # Each run gets a fresh interpreter so the peak RSS is its own
+    out = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            MEASURE,
+            SCRIPT.format(iterations=iterations),
+            "1" if constant_memory else "0",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    peak, rss = map(int, out.split())
+    return peak, rss
+
+
+def main():
+    for iterations in (10**5, 10**6, 10**7):
+        for constant_memory in (False, True):
+            peak, rss = measure(iterations, constant_memory)
+            mode = "constant_memory_loops" if constant_memory else "default"
+            print(
+                f"{iterations:>9} iterations {mode:<22} peak traced {peak / 1024:10.1f}KiB, "
+                f"RSS growth {rss:8d}KiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Times exception-driven control flow, transpiled and as written: a check that raises for
+# every other value, caught by its caller, and a lookup that turns a KeyError into another
+# exception with `raise ... from None` in its except clause.
+# Run from the repository root: python benchmarks/bench_raise.py
+import time
+
+from exprify import transpile_script_source
+
+ITERATIONS = 100_000
+
+SCRIPT = """
+class Invalid(Exception):
+    def __init__(self, value, *, reason):
+        Exception.__init__(self, value)
+        self.reason = reason
+
+
+def check(value):
+    if value % 2:
+        raise Invalid(value, reason="odd")
+    return value
+
+
+def total_valid(n):
+    total = 0
+    i = 0
+    while i < n:
+        try:
+            total += check(i)
+        except Invalid:
+            total -= 1
+        i += 1
+    return total
+
+
+def lookup(table, key):
+    try:
+        return table[key]
+    except KeyError:
+        raise Invalid(key, reason="missing") from None
+
+
+def total_found(n):
+    table = {0: 1}
+    total = 0
+    i = 0
+    while i < n:
+        try:
+            total += lookup(table, i % 2)
+        except Invalid:
+            total -= 1
+        i += 1
+    return total
+"""
+
+
+def timed(func, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    namespace, reference = {}, {}
+    exec(transpile_script_source(SCRIPT), namespace)
+    exec(SCRIPT, reference)
+    for name in ("total_valid", "total_found"):
+        expected, original = timed(reference[name], ITERATIONS)
+        result, transpiled = timed(namespace[name], ITERATIONS)
+        assert result == expected, (result, expected)
+        print(
+            f"{name:<12} original {original * 1000:8.1f}ms | transpiled {transpiled * 1000:8.1f}ms "
+            f"({transpiled / original:.1f}x slower, "
+            f"{transpiled / ITERATIONS * 1e6:.2f}us per iteration)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# Shows how the reflow layout scales with the size of the script.
+# Run from the repository root: python benchmarks/bench_reflow.py
+import time
+from pathlib import Path
+
+from exprify.reflow import prepare_tokens, reflow_lines
+
+ROOT = Path(__file__).parent.parent / "test"
+SCRIPT = (ROOT / "test_scripts" / "zipy.py").read_text()
+OUTLINE = (ROOT / "reflow_outlines" / "outline1.txt").read_text().splitlines()
+
+
+def outline_for(stream):
+    # Repeat the outline until it has room for every token
+    needed = sum(stream.widths) * 2
+    cells = sum(len(line) - line.count(" ") for line in OUTLINE)
+    return OUTLINE * (needed // cells + 1)
+
+
+def main():
+    base = None
+    for factor in (1, 10, 100):
+        stream = prepare_tokens(SCRIPT * factor)
+        outline = outline_for(stream)
+        start = time.perf_counter()
+        lines = list(reflow_lines(stream, outline, 4))
+        elapsed = time.perf_counter() - start
+        base = base or elapsed / len(stream)
+        print(
+            f"{factor:>4}x zipy.py: {len(stream):>7} tokens, {len(lines):>6} lines, "
+            f"{elapsed * 1000:9.1f}ms ({elapsed / len(stream) / base:.2f}x time per token vs 1x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Measures how transpiling one large script scales with the number of processes its top level
+# statements are sharded across.
+# Run from the repository root: python benchmarks/bench_shard.py [max jobs]
+import os
+import sys
+import time
+
+from exprify.cache import CACHE_DISABLE_ENV
+from exprify.transpile import transpile_script_source
+
+FUNCTIONS = 2000
+FUNCTION = """
+def search{i}(items, target):
+    found = -1
+    for i, item in enumerate(items):
+        if item == target + {i}:
+            found = i
+            break
+    return found
+
+
+def parse{i}(values):
+    total = 0
+    for value in values:
+        try:
+            total += int(value) * {i}
+        except ValueError:
+            total += 1
+    return total
+"""
+
+
+def main():
+    # Otherwise every run after the first is only read back from the on-disk cache
+    os.environ[CACHE_DISABLE_ENV] = "1"
+    max_jobs = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1
+    script = "".join(FUNCTION.format(i=i) for i in range(FUNCTIONS))
+    serial = None
+    for jobs in range(1, max_jobs + 1):
+        start = time.perf_counter()
+        transpile_script_source(script, jobs=jobs)
+        elapsed = time.perf_counter() - start
+        serial = serial or elapsed
+        print(
+            f"{jobs:>3} jobs: {elapsed * 1000:8.1f}ms ({serial / elapsed:.2f}x) "
+            f"for {FUNCTIONS * 2} functions"
+        )
+
+
+if __name__ == "__main__":
+    main()
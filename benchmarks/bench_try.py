@@ -0,0 +1,80 @@
+# Times a try inside a hot loop, transpiled and as written, both when the body doesn't raise
+# and when every iteration raises and is handled by one of several except clauses, and a try
+# in a function with many variables, of which the try assigns only one.
+# Run from the repository root: python benchmarks/bench_try.py
+import time
+
+from exprify import transpile_script_source
+
+ITERATIONS = 100_000
+
+SCRIPT = """
+def no_exception(n):
+    total = 0
+    i = 0
+    while i < n:
+        try:
+            total = total + i
+        except TypeError:
+            total = 0
+        i += 1
+    return total
+
+
+def exception(n):
+    lookup = {}
+    total = 0
+    i = 0
+    while i < n:
+        try:
+            total = total + lookup[i]
+        except TypeError:
+            total = 0
+        except ValueError:
+            total = 0
+        except KeyError:
+            total = total + 1
+        i += 1
+    return total
+
+
+def many_locals(n):
+    a, b, c, d, e, f, g, h = range(8)
+    total = 0
+    i = 0
+    while i < n:
+        try:
+            total = total + a + b + c + d + e + f + g + h
+        except TypeError:
+            total = 0
+        i += 1
+    return total
+"""
+
+
+def timed(func, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    namespace, reference = {}, {}
+    exec(transpile_script_source(SCRIPT), namespace)
+    exec(SCRIPT, reference)
+    for name in ("no_exception", "exception", "many_locals"):
+        expected, original = timed(reference[name], ITERATIONS)
+        result, transpiled = timed(namespace[name], ITERATIONS)
+        assert result == expected, (result, expected)
+        print(
+            f"{name:<13} original {original * 1000:8.1f}ms | transpiled {transpiled * 1000:8.1f}ms "
+            f"({transpiled / original:.1f}x slower, "
+            f"{transpiled / ITERATIONS * 1e6:.2f}us per iteration)"
+        )
+
+
+if __name__ == "__main__":
+    main()
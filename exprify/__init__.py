@@ -1,7 +1,10 @@
 from .transpile import (
+    exprified,
     transpiled_function_ast,
     transpiled_function_object,
     transpiled_script,
     transpile_script_source,
 )
-from .reflow import reflow, partition_token
+from .reflow import reflow, iter_reflow, reflow_sweep, best_reflow, partition_token
+from .ast_transformer import TranspileOptions
+from .import_hook import install_import_hook, uninstall_import_hook
@@ -1,20 +1,212 @@
-from exprify import reflow, transpile_script_source
+from exprify import reflow, iter_reflow, best_reflow, transpile_script_source
+from exprify.ast_transformer import TranspileOptions
+from exprify.batch import transpile_tree
+from exprify.cache import CACHE_DISABLE_ENV
+from exprify.incremental import iter_watch
+from exprify.reflow import TOLERANCE, LAYOUTS, LAYOUT_TIME_BUDGET
+from contextlib import nullcontext
 import argparse
+import os
+import sys
+
+
+def tolerance_arg(value):
+    return value if value == "auto" else int(value)
+
+
+def open_outline(path):
+    # "-" reads the outline from stdin
+    return nullcontext(sys.stdin) if path == "-" else open(path)
+
+
+def transpile_options(args):
+    return TranspileOptions(
+        constant_memory_loops=args.constant_memory_loops,
+        shared_runtime=args.shared_runtime,
+        hoist_loop_try=args.hoist_loop_try,
+    )
+
+
+def run_stream(script, args):
+    # Write each reflowed line as soon as it is laid out, reading the outline lazily
+    with open_outline(args.outline) as outline_lines:
+        for line in iter_reflow(
+            script,
+            outline_lines,
+            TOLERANCE if args.tolerance is None else args.tolerance,
+            args.layout,
+            args.time_budget,
+            transpile_options(args),
+        ):
+            sys.stdout.write(line)
+            sys.stdout.flush()
+
+
+def run_batch(args, outline):
+    if not args.output_dir:
+        sys.exit("exprify: --output-dir is required when transpiling several files")
+    results = transpile_tree(
+        args.source,
+        args.output_dir,
+        outline=outline,
+        tolerance=TOLERANCE if args.tolerance is None else args.tolerance,
+        jobs=args.jobs,
+        options=transpile_options(args),
+        layout=args.layout,
+        time_budget=args.time_budget,
+    )
+    failed = [r for r in results if not r.ok]
+    for r in results:
+        status = "ok" if r.ok else f"FAILED ({r.error})"
+        print(f"{r.source} -> {r.output}: {status}", file=sys.stderr)
+    print(
+        f"{len(results) - len(failed)} succeeded, {len(failed)} failed", file=sys.stderr
+    )
+    if failed:
+        sys.exit(1)
+
+
+def run_watch(args):
+    if args.outline or len(args.source) > 1 or os.path.isdir(args.source[0]):
+        sys.exit("exprify: --watch takes a single script and no outline")
+    # Only the top level statements that changed since the last save are lowered again
+    try:
+        for result in iter_watch(args.source[0], transpile_options(args)):
+            if result.ok:
+                with open(args.watch, "w") as f:
+                    f.write(result.script + "\n")
+                status = f"lowered {result.lowered} statements"
+            else:
+                status = f"FAILED ({result.error})"
+            print(
+                f"{args.source[0]} -> {args.watch}: {status} in {result.seconds * 1000:.1f}ms",
+                file=sys.stderr,
+            )
+    except KeyboardInterrupt:
+        pass
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("source", type=str, help="Source code to exprify")
+    parser.add_argument(
+        "source",
+        type=str,
+        nargs="+",
+        help="Source code to exprify. Several files or directories can be given together with --output-dir",
+    )
     parser.add_argument("-o", "--outline", type=str, help="increase output verbosity")
-    parser.add_argument("-t", "--tolerance", type=int, help="increase output verbosity")
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=tolerance_arg,
+        help="how far tokens may overshoot the outline, or 'auto' to try a range of tolerances and keep the best fit",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=LAYOUTS,
+        default="greedy",
+        help="how tokens are packed into the outline: greedily, or by searching for the layout that deviates least from it",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=LAYOUT_TIME_BUDGET,
+        help="seconds the optimal layout may search before finishing greedily",
+    )
+    parser.add_argument(
+        "-d",
+        "--output-dir",
+        type=str,
+        help="write results into this directory, mirroring the layout of the sources",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of worker processes in batch mode (defaults to the CPU count), or to transpile a single script's top level statements with",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="write reflowed lines as they are produced instead of all at once",
+    )
+    parser.add_argument(
+        "--constant-memory-loops",
+        action="store_true",
+        help="lower loops so they keep no per-iteration results, for long running or endless loops",
+    )
+    parser.add_argument(
+        "--hoist-loop-try",
+        action="store_true",
+        help="set up the handlers of a try inside a loop once before the loop, instead of on every iteration",
+    )
+    parser.add_argument(
+        "--shared-runtime",
+        action="store_true",
+        help="import the helpers for exceptions and async functions from exprify.runtime instead of defining them in every output",
+    )
+    parser.add_argument(
+        "--watch",
+        type=str,
+        metavar="OUTPUT",
+        help="keep transpiling the source into OUTPUT every time it changes, only lowering the top level statements that changed",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"don't read or write the on-disk cache (same as setting {CACHE_DISABLE_ENV})",
+    )
     args = parser.parse_args()
-    script = open(args.source).read()
+    if args.no_cache:
+        os.environ[CACHE_DISABLE_ENV] = "1"
+    if args.watch:
+        return run_watch(args)
+    if (
+        args.output_dir
+        or len(args.source) > 1
+        or any(os.path.isdir(s) for s in args.source)
+    ):
+        outline = None
+        if args.outline:
+            with open_outline(args.outline) as f:
+                outline = f.read()
+        return run_batch(args, outline)
+    script = open(args.source[0]).read()
+    if args.outline and args.stream and args.tolerance != "auto":
+        return run_stream(script, args)
+    outline = None
     if args.outline:
-        outline = open(args.outline).read()
-        if args.tolerance:
-            reflowed_script = reflow(script, outline, args.tolerance)
+        with open_outline(args.outline) as f:
+            outline = f.read()
+    if outline and args.tolerance == "auto":
+        best = best_reflow(
+            script,
+            outline,
+            layout=args.layout,
+            time_budget=args.time_budget,
+            jobs=args.jobs,
+            options=transpile_options(args),
+        )
+        print(f"exprify: picked tolerance {best.tolerance}", file=sys.stderr)
+        print(best.text)
+    elif outline:
+        if args.tolerance is not None:
+            reflowed_script = reflow(
+                script,
+                outline,
+                args.tolerance,
+                args.layout,
+                args.time_budget,
+                transpile_options(args),
+            )
         else:
-            reflowed_script = reflow(script, outline)
+            reflowed_script = reflow(
+                script,
+                outline,
+                layout=args.layout,
+                time_budget=args.time_budget,
+                options=transpile_options(args),
+            )
         print(reflowed_script)
     else:
-        print(transpile_script_source(script))
+        print(transpile_script_source(script, transpile_options(args), args.jobs or 1))
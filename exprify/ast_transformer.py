@@ -3,17 +3,193 @@ import itertools
 
 from exprify.injections import Injected
 from contextlib import contextmanager
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
-intermediate_gen = itertools.count(1)
 
+class ExprifyException(Exception):
+    pass
 
-def intermediate_name_gen():
-    return f"inter{next(intermediate_gen)}"
 
+# A loop's control cell is a list whose length is the loop's state, empty while the body runs
+# normally. The length can be tested from builtins without any Python level calls.
+CONTINUE = 1
+BREAK = 2
+
+
+def find_jumps(statements):
+    # The kinds of break and continue statements belonging to the loop whose body is `statements`.
+    # Nested loops and functions have their own, except for the else clause of a nested loop.
+    jumps = set()
+    stack = list(statements)
+    while stack:
+        node = stack.pop()
+        match node:
+            case ast.Break() | ast.Continue():
+                jumps.add(type(node))
+            case ast.For() | ast.While() | ast.AsyncFor():
+                stack.extend(node.orelse)
+            case ast.FunctionDef() | ast.AsyncFunctionDef() | ast.ClassDef():
+                pass
+            case _:
+                stack.extend(
+                    child
+                    for child in ast.iter_child_nodes(node)
+                    if isinstance(child, (ast.stmt, ast.excepthandler))
+                )
+    return jumps
+
+
+@dataclass(frozen=True)
+class TranspileOptions:
+    # Lower loops to comprehensions that keep nothing per iteration, so long or endless loops
+    # run in constant memory. The loop itself then evaluates to an empty list.
+    constant_memory_loops: bool = False
+    # Import the injected helpers from exprify.runtime, rather than defining them in the output,
+    # which then needs exprify installed to run
+    shared_runtime: bool = False
+    # Build the locals dict, handlers and iEH of a try directly inside a loop once, before the
+    # loop, rather than on every iteration. The types the try catches are then evaluated before
+    # the loop, so it is only done when none of the names in them change inside the loop.
+    hoist_loop_try: bool = False
+
+
+def stored_names(nodes):
+    return {
+        n.id
+        for node in nodes
+        for n in ast.walk(node)
+        if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)
+    }
+
+
+def loaded_names(nodes):
+    return {
+        n.id
+        for node in nodes
+        for n in ast.walk(node)
+        if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)
+    }
+
+
+def invariant(node, changing):
+    # Whether an expression is made of names that don't change and their attributes, so that
+    # evaluating it earlier gives the same result
+    match node:
+        case ast.Name():
+            return node.id not in changing
+        case ast.Attribute():
+            return invariant(node.value, changing)
+        case ast.Tuple():
+            return all(invariant(elt, changing) for elt in node.elts)
+    return False
+
+
+def walk_function(nodes):
+    # Walks the nodes of a function body, without descending into nested functions and classes
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(
+            node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+        ):
+            stack.extend(ast.iter_child_nodes(node))
+
+
+def parameters(args):
+    return [
+        *args.posonlyargs,
+        *args.args,
+        *args.kwonlyargs,
+        *[arg for arg in (args.vararg, args.kwarg) if arg],
+    ]
+
+
+def assigned_names(nodes):
+    # The names assigned by assignment statements in a block, outside nested functions and
+    # classes. Loop targets and the like are bound inside the lambdas the block is lowered to.
+    names = set()
+    for node in walk_function(nodes):
+        match node:
+            case ast.Assign():
+                names |= stored_names(node.targets)
+            case ast.AugAssign() | ast.AnnAssign():
+                names |= stored_names([node.target])
+    return names
+
+
+class LocalsReader(ast.NodeTransformer):
+    # Reads the variables a try assigns from the try's locals dict, which the lambdas it is
+    # lowered to update in their place. Every other name is still read directly.
+    def __init__(self, names, locals_name):
+        self.names = names
+        self.locals_name = locals_name
 
-class ExprifyException(Exception):
-    pass
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and node.id in self.names:
+            return ast.Call(
+                func=ast.Attribute(
+                    value=ast.Name(id=self.locals_name, ctx=ast.Load()),
+                    attr="get",
+                    ctx=ast.Load(),
+                ),
+                args=[ast.Constant(node.id)],
+                keywords=[],
+            )
+        return node
+
+    def shadowed(self, node, names):
+        outer = self.names
+        self.names = outer - names
+        self.generic_visit(node)
+        self.names = outer
+        return node
+
+    def visit_Lambda(self, node):
+        return self.shadowed(node, {arg.arg for arg in parameters(node.args)})
+
+    def visit_comprehension_node(self, node):
+        # The first iterable is evaluated outside the comprehension
+        first = node.generators[0]
+        first.iter = self.visit(first.iter)
+        iterable, first.iter = first.iter, ast.Constant(value=None)
+        self.shadowed(node, stored_names(g.target for g in node.generators))
+        first.iter = iterable
+        return node
+
+    visit_ListComp = (
+        visit_SetComp
+    ) = visit_DictComp = visit_GeneratorExp = visit_comprehension_node
+
+    def visit_ExceptHandler(self, node):
+        return self.shadowed(node, {node.name} if node.name else set())
+
+    def visit_FunctionDef(self, node):
+        return node
+
+    visit_AsyncFunctionDef = visit_ClassDef = visit_FunctionDef
+
+
+def contains_yield(nodes):
+    return any(
+        isinstance(node, (ast.Yield, ast.YieldFrom)) for node in walk_function(nodes)
+    )
+
+
+def awaits(node, in_lambda=False):
+    # Yields, for every await in an expression, whether it runs directly in a lambda, where it
+    # can't be made asynchronous. Generator expressions become asynchronous themselves, apart
+    # from their first iterable which runs where they are created.
+    if isinstance(node, ast.Await) or getattr(node, "is_async", False):
+        yield in_lambda
+    match node:
+        case ast.Lambda():
+            yield from awaits(node.body, True)
+        case ast.GeneratorExp():
+            yield from awaits(node.generators[0].iter, in_lambda)
+        case _:
+            for child in ast.iter_child_nodes(node):
+                yield from awaits(child, in_lambda)
 
 
 @dataclass
@@ -46,14 +222,26 @@ class Scope:
         return len(self.locals_names) > 0
 
     @contextmanager
-    def enter_nested_scope(self):
-        self.locals_names.append(intermediate_name_gen())
+    def enter_nested_scope(self, locals_name):
+        self.locals_names.append(locals_name)
         yield
         self.locals_names.pop(-1)
 
 
+@dataclass
+class LoopHoist:
+    # What the body of a loop sets up once, before the comprehension the loop is lowered to
+    scope: Scope
+    # The names the comprehension binds, which only exist inside it
+    targets: set
+    # The names assigned in the loop's body, which may change from one iteration to the next
+    assigned: set
+    setup: list = field(default_factory=list)
+
+
 class Scopes:
-    scopes: list[Scope] = [Scope({}, [], is_global=True)]
+    def __init__(self):
+        self.scopes = [Scope({}, [], is_global=True)]
 
     def current_scope(self):
         return self.scopes[-1]
@@ -75,9 +263,42 @@ class Scopes:
 
 
 class StatementMapper(ast.NodeTransformer):
-    top_level = True
-    required_injects = set()
-    scopes: Scopes = Scopes()
+    def __init__(self, options=TranspileOptions()):
+        # All state belongs to the instance, so that transpiles can run concurrently and
+        # identical sources always get the same intermediate names
+        self.options = options
+        self.top_level = True
+        self.required_injects = set()
+        self.scopes = Scopes()
+        self.intermediate_names = itertools.count(1)
+        # Names of the control cells of the loops being lowered, innermost last, or None for
+        # loops without a break or continue
+        self.loop_controls = []
+        # Where the tries in the body of the loops being lowered can hoist what they set up, or
+        # None inside functions, which are run separately from the loops around them
+        self.loop_hoists = []
+        # Names the exceptions are passed as to the except clauses being lowered, innermost last
+        self.handler_names = []
+
+    def visit(self, node):
+        # What a statement is lowered to takes the statement's location, which
+        # fix_missing_locations then passes on to the nodes built for it
+        lowered = super().visit(node)
+        if isinstance(node, ast.stmt) and isinstance(lowered, ast.AST):
+            if not hasattr(lowered, "lineno") and "lineno" in lowered._attributes:
+                ast.copy_location(lowered, node)
+        return lowered
+
+    def intermediate_name_gen(self):
+        return f"inter{next(self.intermediate_names)}"
+
+    @contextmanager
+    def enter_loop(self, control, hoist=None):
+        self.loop_controls.append(control)
+        self.loop_hoists.append(hoist)
+        yield
+        self.loop_hoists.pop(-1)
+        self.loop_controls.pop(-1)
 
     def visit_If(self, node):
         return ast.IfExp(
@@ -148,9 +369,9 @@ class StatementMapper(ast.NodeTransformer):
             target_load = self.get_Locals(
                 target_load, self.scopes.current_scope().get_current_locals_name()
             )
-        return ast.NamedExpr(
-            target=node.target,
-            value=ast.BinOp(left=target_load, op=node.op, right=node.value),
+        # Inside a try this updates the locals dict, as a walrus would only bind in the lambda
+        return self.generate_Assignment(
+            node.target, ast.BinOp(left=target_load, op=node.op, right=node.value)
         )
 
     def import_Helper(self, node, imp_gen):
@@ -158,29 +379,51 @@ class StatementMapper(ast.NodeTransformer):
         if len(imps) > 1:
             return ast.Tuple(elts=imps, ctx=ast.Load())
         else:
-            return ast.Expr(value=imps[0])
+            return imps[0]
 
-    def module_import_Helper(self, module):
-        # We cannot just call __import__ on things like `urllib.urlparse`,
-        # so we must recursively wrap each period delimited section of the import
-        # clause with getattr calls
+    def module_import_Helper(self, module, imported=None):
+        # __import__ on things like `urllib.parse` imports the submodule but returns the top
+        # level package, so we must recursively wrap each period delimited section of the
+        # import clause with getattr calls
         if "." in module:
             module, last = module.rsplit(".", 1)
             return ast.Call(
                 func=ast.Name(id="getattr", ctx=ast.Load()),
-                args=[self.module_import_Helper(module), ast.Constant(value=last)],
+                args=[
+                    self.module_import_Helper(module, imported or f"{module}.{last}"),
+                    ast.Constant(value=last),
+                ],
                 keywords=[],
             )
         return ast.Call(
             func=ast.Name(id="__import__", ctx=ast.Load()),
-            args=[ast.Constant(value=module)],
+            args=[ast.Constant(value=imported or module)],
             keywords=[],
         )
 
     def visit_ImportFrom(self, node):
         # Replace from library import function with getattr(__import__(library), function) calls
         def imp_gen(name):
-            module = self.module_import_Helper(node.module)
+            if node.level:
+                # Relative imports are resolved against the module's own package, taken from
+                # its globals, and the fromlist makes __import__ return the module itself
+                module = ast.Call(
+                    func=ast.Name(id="__import__", ctx=ast.Load()),
+                    args=[
+                        ast.Constant(value=node.module or ""),
+                        ast.Call(
+                            func=ast.Name(id="globals", ctx=ast.Load()),
+                            args=[],
+                            keywords=[],
+                        ),
+                        ast.Constant(value=None),
+                        ast.Tuple(elts=[ast.Constant(value=name.name)], ctx=ast.Load()),
+                        ast.Constant(value=node.level),
+                    ],
+                    keywords=[],
+                )
+            else:
+                module = self.module_import_Helper(node.module)
             as_name = name.asname if name.asname else name.name
             return ast.NamedExpr(
                 target=ast.Name(id=as_name, ctx=ast.Store()),
@@ -212,6 +455,7 @@ class StatementMapper(ast.NodeTransformer):
                     ctx=ast.Load(),
                 ),
                 attr="update",
+                ctx=ast.Load(),
             ),
             args=[],
             keywords=[ast.keyword(arg=name, value=value)],
@@ -222,7 +466,9 @@ class StatementMapper(ast.NodeTransformer):
             case ast.Name:
                 return ast.Call(
                     func=ast.Attribute(
-                        value=ast.Name(id=intermediate_name, ctx=ast.Load()), attr="get"
+                        value=ast.Name(id=intermediate_name, ctx=ast.Load()),
+                        attr="get",
+                        ctx=ast.Load(),
                     ),
                     args=[ast.Constant(node.id)],
                     keywords=[],
@@ -233,11 +479,13 @@ class StatementMapper(ast.NodeTransformer):
                         func=ast.Attribute(
                             value=ast.Name(id=intermediate_name, ctx=ast.Load()),
                             attr="get",
+                            ctx=ast.Load(),
                         ),
                         args=[ast.Constant(node.value)],
                         keywords=[],
                     ),
                     attr=node.attr,
+                    ctx=ast.Load(),
                 )
                 return ret
         return node
@@ -258,14 +506,6 @@ class StatementMapper(ast.NodeTransformer):
                 keywords=[],
             )
 
-    def visit_Name(self, node):
-        if self.scopes.current_scope().in_nested_scope:
-            return self.get_Locals(
-                node, self.scopes.current_scope().get_current_locals_name()
-            )
-        else:
-            return node
-
     def visit_Assign(self, node):
         if self.scopes.has_scope():
             self.scopes.current_scope().extend_vars(node.targets)
@@ -273,7 +513,7 @@ class StatementMapper(ast.NodeTransformer):
             return node
         if len(node.targets) == 1:
             if isinstance(node.targets[0], ast.Tuple):
-                intermediate_name = intermediate_name_gen()
+                intermediate_name = self.intermediate_name_gen()
                 intermediate = ast.NamedExpr(
                     target=ast.Name(id=intermediate_name, ctx=ast.Store()),
                     value=node.value,
@@ -298,21 +538,171 @@ class StatementMapper(ast.NodeTransformer):
             ]
         return ast.List(elts=targets, ctx=ast.Load())
 
-    def visit_For(self, node):
+    def loop_comprehension(self, body, target, iterator, is_async=False):
+        if not self.options.constant_memory_loops:
+            return ast.ListComp(
+                elt=body,
+                generators=[
+                    ast.comprehension(
+                        target=target, iter=iterator, is_async=is_async, ifs=[]
+                    )
+                ],
+            )
+        # Evaluate the body in the comprehension's filter as `not [body]`, which is always false,
+        # so no element is ever added to the list. Wrapping the body in a list means its value is
+        # never truth tested.
         return ast.ListComp(
-            elt=self.map_body(node),
+            elt=ast.Constant(value=None),
             generators=[
                 ast.comprehension(
-                    target=node.target,
-                    iter=node.iter,
-                    is_async=False,
-                    ifs=[],
+                    target=target,
+                    iter=iterator,
+                    is_async=is_async,
+                    ifs=[
+                        ast.UnaryOp(
+                            op=ast.Not(), operand=ast.List(elts=[body], ctx=ast.Load())
+                        )
+                    ],
                 )
             ],
         )
 
+    def loop_broken(self, control):
+        return ast.Compare(
+            left=ast.Call(
+                func=ast.Name(id="len", ctx=ast.Load()),
+                args=[ast.Name(id=control, ctx=ast.Load())],
+                keywords=[],
+            ),
+            ops=[ast.Eq()],
+            comparators=[ast.Constant(value=BREAK)],
+        )
+
+    def set_loop_control(self, control, state):
+        # The state is only ever set from an empty cell, as nothing runs after break or continue
+        return ast.Call(
+            func=ast.Attribute(
+                value=ast.Name(id=control, ctx=ast.Load()),
+                attr="extend",
+                ctx=ast.Load(),
+            ),
+            args=[ast.Tuple(elts=[ast.Constant(value=0)] * state, ctx=ast.Load())],
+            keywords=[],
+        )
+
+    def clear_loop_control(self, control):
+        return ast.Call(
+            func=ast.Attribute(
+                value=ast.Name(id=control, ctx=ast.Load()), attr="clear", ctx=ast.Load()
+            ),
+            args=[],
+            keywords=[],
+        )
+
+    def lower_loop(
+        self, node, target, iterator, control=None, setup=(), is_async=False
+    ):
+        # break and continue set the loop's control cell, which is a list so that it can be set
+        # from inside the lambdas that try bodies are lowered to. Statements that follow one that
+        # might have set it are skipped, and the iterator stops once it reads BREAK.
+        hoist = LoopHoist(
+            self.scopes.current_scope(), stored_names([target]), stored_names(node.body)
+        )
+        with self.enter_loop(control, hoist):
+            body = self.map_body(node)
+        setup = [*setup, *hoist.setup]
+        if ast.Continue in find_jumps(node.body):
+            body = ast.List(
+                elts=[self.clear_loop_control(control), body], ctx=ast.Load()
+            )
+        loop = self.loop_comprehension(body, target, iterator, is_async)
+        if not node.orelse:
+            return ast.List(elts=[*setup, loop], ctx=ast.Load()) if setup else loop
+        orelse = self.map_body(node.orelse)
+        if control:
+            # The else clause only runs when the loop wasn't broken out of
+            orelse = ast.IfExp(
+                test=self.loop_broken(control),
+                body=ast.Constant(value=None),
+                orelse=orelse,
+            )
+        return ast.List(elts=[*setup, loop, orelse], ctx=ast.Load())
+
+    def visit_For(self, node):
+        jumps = find_jumps(node.body)
+        if ast.Break not in jumps:
+            # Without a break the loop can iterate normally, continue only needs a control cell
+            control = self.intermediate_name_gen() if jumps else None
+            setup = [self.new_loop_control(control)] if control else []
+            return self.lower_loop(node, node.target, node.iter, control, setup)
+        control = self.intermediate_name_gen()
+        # zip takes from iter(control.__len__, BREAK) first, which runs out as soon as the loop
+        # is broken out of, so it stops without taking another item from the iterable. Both
+        # calls are builtins, so this adds no Python level call per iteration.
+        iterator = ast.Call(
+            func=ast.Name(id="zip", ctx=ast.Load()),
+            args=[
+                ast.Call(
+                    func=ast.Name(id="iter", ctx=ast.Load()),
+                    args=[
+                        ast.Attribute(
+                            value=ast.Name(id=control, ctx=ast.Load()),
+                            attr="__len__",
+                            ctx=ast.Load(),
+                        ),
+                        ast.Constant(value=BREAK),
+                    ],
+                    keywords=[],
+                ),
+                node.iter,
+            ],
+            keywords=[],
+        )
+        target = ast.Tuple(
+            elts=[ast.Name(id="_", ctx=ast.Store()), node.target], ctx=ast.Store()
+        )
+        return self.lower_loop(
+            node, target, iterator, control, [self.new_loop_control(control)]
+        )
+
+    def new_loop_control(self, control):
+        return ast.NamedExpr(
+            target=ast.Name(id=control, ctx=ast.Store()),
+            value=ast.List(elts=[], ctx=ast.Load()),
+        )
+
     def visit_While(self, node):
+        if list(awaits(node.test)):
+            # The condition can't be awaited inside iter's lambda, so loop forever and test it
+            # at the top of the body instead
+            if find_jumps(node.orelse):
+                raise ExprifyException(
+                    "Exprify does not support 'break' or 'continue' in the else clause of a "
+                    "while loop whose condition awaits"
+                )
+            node = ast.While(
+                test=ast.Constant(value=True),
+                body=[
+                    ast.If(
+                        test=ast.UnaryOp(op=ast.Not(), operand=node.test),
+                        body=[*node.orelse, ast.Break()],
+                        orelse=[],
+                    ),
+                    *node.body,
+                ],
+                orelse=[],
+            )
         condition = node.test
+        jumps = find_jumps(node.body)
+        control = self.intermediate_name_gen() if jumps else None
+        if ast.Break in jumps:
+            condition = ast.BoolOp(
+                op=ast.And(),
+                values=[
+                    ast.UnaryOp(op=ast.Not(), operand=self.loop_broken(control)),
+                    condition,
+                ],
+            )
         # This is an ast equivalent of iter(lambda: condition, False), which will produce true (potentially infinitely)
         # until condition is false. This nicely sidesteps having to use takewhile, or other equivalents for emulating while loops
         # in list comprehensions.
@@ -333,17 +723,9 @@ class StatementMapper(ast.NodeTransformer):
             ],
             keywords=[],
         )
-
-        return ast.ListComp(
-            elt=self.map_body(node),
-            generators=[
-                ast.comprehension(
-                    target=ast.Name(id="_", ctx=ast.Store()),
-                    iter=iterator,
-                    is_async=False,
-                    ifs=[],
-                )
-            ],
+        setup = [self.new_loop_control(control)] if control else []
+        return self.lower_loop(
+            node, ast.Name(id="_", ctx=ast.Store()), iterator, control, setup
         )
 
     def visit_Return(self, node):
@@ -366,6 +748,18 @@ class StatementMapper(ast.NodeTransformer):
         # If node is from an If-orelse, it will be a list, not a node with a body.
         body = node if isinstance(node, list) else node.body
         statements = [self.map_stmt(i) for i in body]
+        control = self.loop_controls[-1] if self.loop_controls else None
+        if control:
+            # Skip everything after a statement that might break or continue
+            jumped = False
+            for index, stmt in enumerate(body):
+                if jumped:
+                    statements[index] = ast.IfExp(
+                        test=ast.Name(id=control, ctx=ast.Load()),
+                        body=ast.Constant(value=None),
+                        orelse=statements[index],
+                    )
+                jumped = jumped or bool(find_jumps([stmt]))
 
         # If there's nothing in the body, return None.
         if not statements or statements[0] is None:
@@ -385,7 +779,7 @@ class StatementMapper(ast.NodeTransformer):
     def visit_ClassDef(self, node):
         class_body_dict = {}
         for subnode in node.body:
-            if isinstance(subnode, ast.FunctionDef):
+            if isinstance(subnode, (ast.FunctionDef, ast.AsyncFunctionDef)):
                 class_body_dict[subnode.name] = self.visit_FunctionDef(
                     subnode, class_def=True
                 )
@@ -402,7 +796,7 @@ class StatementMapper(ast.NodeTransformer):
                 func=ast.Name(id="type", ctx=ast.Load()),
                 args=[
                     ast.Constant(value=node.name),
-                    ast.Tuple(elts=[], ctx=ast.Load()),
+                    ast.Tuple(elts=node.bases, ctx=ast.Load()),
                     class_body,
                 ],
                 keywords=[],
@@ -413,33 +807,268 @@ class StatementMapper(ast.NodeTransformer):
         # Remove type annotations
         for arg in node.args.args:
             arg.annotation = None
-        with self.scopes.enter_scope():
+        # Loops around the function don't extend into it
+        with self.scopes.enter_scope(), self.enter_loop(None):
+            # A try assigning to a parameter starts from the value it was called with
+            self.scopes.current_scope().extend_vars(
+                ast.Name(id=arg.arg, ctx=ast.Store()) for arg in parameters(node.args)
+            )
             # If the function is top level, we want to use normal assignment. Otherwise, has to be a named expression.
-            if self.top_level:
-                self.top_level = False
-                function_body = self.map_body(node)
-                self.scope_vars = []
-                self.top_level = True
+            # Methods are always lambdas in the class's dict, even in a class at the top level.
+            top_level = self.top_level
+            self.top_level = False
+            # A function defined in an except clause is called later, when the exception being
+            # handled, if any, is another one
+            handler_names = self.handler_names
+            self.handler_names = [None] if handler_names else []
+            function_body = self.map_function_body(node)
+            self.handler_names = handler_names
+            self.top_level = top_level
+            lambda_func = ast.Lambda(args=node.args, body=function_body)
+            if class_def:
+                return lambda_func
+            if top_level:
                 return ast.Assign(
                     targets=[ast.Name(id=node.name, ctx=ast.Store())],
-                    value=ast.Lambda(args=node.args, body=function_body),
-                )
-            else:
-                function_body = self.map_body(node)
-                lambda_func = ast.Lambda(args=node.args, body=function_body)
-                if class_def:
-                    return lambda_func
-                return ast.NamedExpr(
-                    target=ast.Name(id=node.name, ctx=ast.Store()),
                     value=lambda_func,
                 )
+            return ast.NamedExpr(
+                target=ast.Name(id=node.name, ctx=ast.Store()),
+                value=lambda_func,
+            )
+
+    def visit_AsyncFunctionDef(self, node, class_def=False):
+        return self.visit_FunctionDef(node, class_def)
+
+    def map_function_body(self, node):
+        if isinstance(node, ast.AsyncFunctionDef):
+            return self.map_coroutine_body(node)
+        if not contains_yield(node.body):
+            return self.map_body(node)
+        if any(isinstance(n, ast.Return) for n in walk_function(node.body)):
+            raise ExprifyException("Exprify does not support 'return' in generators")
+        self.required_injects.add(Injected.CHAIN)
+        return self.map_generator_body(node.body)
+
+    def map_coroutine_body(self, node):
+        # Async functions are lowered to an asynchronous generator expression that yields the
+        # function's result once, which aC drives as a coroutine. The awaits stay awaits, so
+        # the function still suspends and runs concurrently with others on the event loop.
+        if contains_yield(node.body):
+            raise ExprifyException("Exprify does not support async generators")
+        self.required_injects.add(Injected.COROUTINE)
+        body = self.map_body(node)
+        in_lambda = list(awaits(body))
+        if any(in_lambda):
+            raise ExprifyException(
+                "Exprify does not support 'await' where it is lowered into a lambda, such as in 'try'"
+            )
+        if not in_lambda:
+            # Without an await the generator expression wouldn't be asynchronous
+            body = ast.Subscript(
+                value=ast.List(
+                    elts=[ast.Await(value=ast.Name(id="aN", ctx=ast.Load())), body],
+                    ctx=ast.Load(),
+                ),
+                slice=ast.UnaryOp(op=ast.USub(), operand=ast.Constant(value=1)),
+                ctx=ast.Load(),
+            )
+        return ast.Call(
+            func=ast.Name(id="aC", ctx=ast.Load()),
+            args=[ast.GeneratorExp(elt=body, generators=[self.once()])],
+            keywords=[],
+        )
+
+    # Generator functions are lowered to a lazy iterator built from generator expressions, which
+    # are chained together by gC (itertools.chain.from_iterable). Every generator expression
+    # iterates over a constant (0,) first, so creating one runs none of the code inside it, and
+    # the code of the function only runs as values are asked for. User code only ever appears in
+    # the element and filter positions, where assignment expressions are allowed.
+
+    def chain_iterables(self, element, generators):
+        return ast.Call(
+            func=ast.Name(id="gC", ctx=ast.Load()),
+            args=[ast.GeneratorExp(elt=element, generators=generators)],
+            keywords=[],
+        )
+
+    def once(self, ifs=()):
+        return ast.comprehension(
+            target=ast.Name(id="_", ctx=ast.Store()),
+            iter=ast.Tuple(elts=[ast.Constant(value=0)], ctx=ast.Load()),
+            is_async=False,
+            ifs=list(ifs),
+        )
+
+    def generator_step(self, statements, value=None):
+        # Runs the statements in the filter, and then yields value if there is one. A list is
+        # always truthy, so the statements' values are never truth tested.
+        run = [ast.List(elts=statements, ctx=ast.Load())] if statements else []
+        if value is None:
+            return ast.GeneratorExp(
+                elt=ast.Constant(value=None),
+                generators=[self.once([ast.UnaryOp(op=ast.Not(), operand=run[0])])],
+            )
+        return ast.GeneratorExp(elt=value, generators=[self.once(run)])
+
+    def map_generator_body(self, body):
+        segments, pending = [], []
+        for stmt in body:
+            if not contains_yield([stmt]):
+                pending.append(self.map_stmt(stmt))
+                continue
+            match stmt:
+                case ast.Expr(value=ast.Yield(value=value)):
+                    value = value or ast.Constant(value=None)
+                    segments.append(self.generator_step(pending, self.visit(value)))
+                    pending = []
+                    continue
+            if pending:
+                segments.append(self.generator_step(pending))
+                pending = []
+            match stmt:
+                case ast.Expr(value=ast.YieldFrom(value=value)):
+                    segments.append(
+                        self.chain_iterables(self.visit(value), [self.once()])
+                    )
+                case ast.For() | ast.While():
+                    segments.append(self.generator_loop(stmt))
+                case ast.If():
+                    segments.append(
+                        self.chain_iterables(
+                            ast.IfExp(
+                                test=self.visit(stmt.test),
+                                body=self.map_generator_body(stmt.body),
+                                orelse=self.map_generator_body(stmt.orelse),
+                            ),
+                            [self.once()],
+                        )
+                    )
+                case _:
+                    # Mapping it as a normal statement raises for the yield inside
+                    self.map_stmt(stmt)
+        if pending:
+            segments.append(self.generator_step(pending))
+        if not segments:
+            return ast.Tuple(elts=[], ctx=ast.Load())
+        if len(segments) == 1:
+            return segments[0]
+        return ast.Call(
+            func=ast.Name(id="gC", ctx=ast.Load()),
+            args=[ast.Tuple(elts=segments, ctx=ast.Load())],
+            keywords=[],
+        )
+
+    def generator_loop(self, node):
+        if find_jumps(node.body):
+            raise ExprifyException(
+                "Exprify does not support 'break' or 'continue' in generators"
+            )
+        body = self.map_generator_body(node.body)
+        if isinstance(node, ast.For):
+            loop = self.chain_iterables(
+                body,
+                [
+                    self.once(),
+                    ast.comprehension(
+                        target=node.target, iter=node.iter, is_async=False, ifs=[]
+                    ),
+                ],
+            )
+        else:
+            # The same iter(lambda: condition, False) as visit_While, which is only evaluated
+            # once iteration starts
+            loop = self.chain_iterables(
+                body,
+                [
+                    ast.comprehension(
+                        target=ast.Name(id="_", ctx=ast.Store()),
+                        iter=ast.Call(
+                            func=ast.Name(id="iter", ctx=ast.Load()),
+                            args=[
+                                ast.Lambda(
+                                    args=ast.arguments(
+                                        posonlyargs=[],
+                                        args=[],
+                                        kwonlyargs=[],
+                                        kw_defaults=[],
+                                        defaults=[],
+                                    ),
+                                    body=node.test,
+                                ),
+                                ast.Constant(value=False),
+                            ],
+                            keywords=[],
+                        ),
+                        is_async=False,
+                        ifs=[],
+                    )
+                ],
+            )
+        if not node.orelse:
+            return loop
+        return ast.Call(
+            func=ast.Name(id="gC", ctx=ast.Load()),
+            args=[
+                ast.Tuple(
+                    elts=[loop, self.map_generator_body(node.orelse)], ctx=ast.Load()
+                )
+            ],
+            keywords=[],
+        )
 
     def visit_Raise(self, node):
+        # The exception is thrown as it is, or with its cause set first for `raise ... from`.
+        # In an except clause its context is the exception the clause handles, and a bare
+        # raise throws that exception again. Except clauses are passed the exception, so it is
+        # only taken from sys in functions defined in except clauses, and for a bare raise
+        # outside of them.
         self.required_injects.add(Injected.RAISE)
-        return ast.Call(
-            func=ast.Name(id="rH", ctx=ast.Load()),
-            args=[node.exc],
-            keywords=[node.cause] if node.cause else [],
+        handled = None
+        if self.handler_names:
+            handled = self.handler_names[-1]
+            handled = (
+                ast.Name(id=handled, ctx=ast.Load())
+                if handled
+                else self.active_exception()
+            )
+        exc = node.exc
+        if exc is None:
+            if isinstance(handled, ast.Name):
+                return ast.Call(
+                    func=ast.Name(id="rT", ctx=ast.Load()), args=[handled], keywords=[]
+                )
+            # There may be no active exception to raise again
+            return ast.Call(
+                func=ast.Name(id="rR", ctx=ast.Load()),
+                args=[self.active_exception()],
+                keywords=[],
+            )
+        if handled:
+            exc = ast.Call(
+                func=ast.Name(id="rC", ctx=ast.Load()), args=[exc, handled], keywords=[]
+            )
+        if node.cause is not None:
+            return ast.Call(
+                func=ast.Name(id="rH", ctx=ast.Load()),
+                args=[exc, node.cause],
+                keywords=[],
+            )
+        return ast.Call(func=ast.Name(id="rT", ctx=ast.Load()), args=[exc], keywords=[])
+
+    def active_exception(self):
+        return ast.Subscript(
+            value=ast.Call(
+                func=ast.Attribute(
+                    value=self.module_import_Helper("sys"),
+                    attr="exc_info",
+                    ctx=ast.Load(),
+                ),
+                args=[],
+                keywords=[],
+            ),
+            slice=ast.Constant(value=1),
+            ctx=ast.Load(),
         )
 
     def reassign_Locals(self, intermediate_name, scope_vars):
@@ -453,6 +1082,7 @@ class StatementMapper(ast.NodeTransformer):
                         ctx=ast.Load(),
                     ),
                     attr="update",
+                    ctx=ast.Load(),
                 ),
                 args=[],
                 keywords=[
@@ -483,10 +1113,14 @@ class StatementMapper(ast.NodeTransformer):
             )
 
         # if we're at the top level, we just want to rebind the values in scope into the intermediate dict
-        arguments = [ast.keyword(arg=a, value=v) for a, v in scope_vars.items()]
+        arguments = [
+            ast.keyword(arg=a, value=ast.Name(id=a, ctx=ast.Load())) for a in scope_vars
+        ]
         return ast.NamedExpr(
             target=ast.Name(id=intermediate_name, ctx=ast.Store()),
-            value=ast.Call(func=ast.Name(id="dict"), args=[], keywords=arguments),
+            value=ast.Call(
+                func=ast.Name(id="dict", ctx=ast.Load()), args=[], keywords=arguments
+            ),
         )
 
     def visit_Try(self, node):
@@ -512,17 +1146,32 @@ class StatementMapper(ast.NodeTransformer):
         # and inject an intermediate dictionary that copies variables from the local scope, and then reassigns them at the
         # end. Each new nested scope needs to copy the previous nests' dictionary, and then also reassign to that dictionary
         # at the end.
+        # Only the variables assigned somewhere in the try go through the dictionary. The lambdas read everything else
+        # directly from the enclosing scope, which is cheaper and sees globals, builtins and parameters as they are.
         self.required_injects.add(Injected.EXCEPT)
-        intermediate_name = intermediate_name_gen()
+        intermediate_name = self.intermediate_name_gen()
+        nested = self.scopes.current_scope().in_nested_scope
+        assigned = assigned_names([*node.body, *node.handlers, *node.finalbody])
 
         def assign_return_value(node):
             return self.update_Locals(intermediate_name, node)
 
-        with self.scopes.current_scope().enter_nested_scope():
+        with self.scopes.current_scope().enter_nested_scope(
+            self.intermediate_name_gen()
+        ):
             intermediate_locals = self.scopes.current_scope().get_current_locals_name()
             define_local_dict = self.assign_Locals_Intermediate(
-                intermediate_locals, self.scopes.current_scope().variables
+                intermediate_locals,
+                [
+                    name
+                    for name in self.scopes.current_scope().variables
+                    if name in assigned
+                ],
             )
+            reader = LocalsReader(assigned, intermediate_locals)
+            node.body = [reader.visit(stmt) for stmt in node.body]
+            node.handlers = [reader.visit(handler) for handler in node.handlers]
+            node.finalbody = [reader.visit(stmt) for stmt in node.finalbody]
 
             # need to figure out which variables are used in the lambda body and which ones are also in the greater scope and
             # add them as default kw arguments
@@ -564,7 +1213,7 @@ class StatementMapper(ast.NodeTransformer):
                 keys=[k.type for k in separated_handlers],
                 values=[
                     ast.Lambda(
-                        body=assign_return_value(self.map_body(v.body)),
+                        body=assign_return_value(self.map_handler(v)),
                         args=ast.arguments(
                             posonlyargs=[],
                             args=[ast.arg(v.name or "exception")],
@@ -579,8 +1228,8 @@ class StatementMapper(ast.NodeTransformer):
 
             ctx_mgr = ast.Call(
                 func=ast.Name(id="iEH", ctx=ast.Load()),
-                args=[],
-                keywords=[except_types, final_callable],
+                args=[except_types, final_callable],
+                keywords=[],
             )
 
             # Wrap the body of the try: except clause in the context manager to catch exceptions
@@ -590,6 +1239,24 @@ class StatementMapper(ast.NodeTransformer):
                 keywords=[],
             )
 
+        hoist = self.loop_hoists[-1] if self.loop_hoists else None
+        if (
+            self.options.hoist_loop_try
+            and hoist
+            and not nested
+            and hoist.scope is self.scopes.current_scope()
+        ):
+            hoisted = self.hoist_Try(
+                hoist,
+                assigned,
+                intermediate_name,
+                define_local_dict,
+                ctx_mgr,
+                try_callable,
+            )
+            if hoisted is not None:
+                return hoisted
+
         # Wrap the wrapped function call in a list with the last element being the intermediate value assigned to by the
         # except clauses and/or finally clause
         return ast.Subscript(
@@ -598,29 +1265,132 @@ class StatementMapper(ast.NodeTransformer):
                     define_local_dict,
                     wrapped_fun_call,
                     self.reassign_Locals(
-                        intermediate_locals, self.scopes.current_scope().vars
+                        intermediate_locals,
+                        [
+                            var
+                            for var in self.scopes.current_scope().vars
+                            if var.id in assigned
+                        ],
                     ),
                     self.get_Locals(
                         ast.Name(id=intermediate_name, ctx=ast.Load()),
                         intermediate_locals,
                     ),
-                ]
+                ],
+                ctx=ast.Load(),
+            ),
+            slice=ast.Constant(value=-1),
+            ctx=ast.Load(),
+        )
+
+    def map_handler(self, handler):
+        self.handler_names.append(handler.name or "exception")
+        body = self.map_body(handler.body)
+        self.handler_names.pop()
+        return body
+
+    def hoist_Try(
+        self,
+        hoist,
+        assigned,
+        intermediate_name,
+        define_local_dict,
+        ctx_mgr,
+        try_callable,
+    ):
+        # The locals dict and the iEH wrapping the body are made before the loop, and every
+        # iteration refreshes the dict and runs the body. The names the comprehension binds
+        # are passed to the body, as it is no longer inside the comprehension. Returns None if
+        # the try depends on the iteration in a way that can't be hoisted.
+        except_types, final_callable = ctx_mgr.args
+        changing = hoist.targets | hoist.assigned
+        if not all(invariant(k, changing) for k in except_types.keys):
+            return None
+        if loaded_names([*except_types.values, final_callable]) & hoist.targets:
+            return None
+        params = sorted(loaded_names([try_callable]) & hoist.targets)
+        if set(params) & hoist.assigned:
+            return None
+        intermediate_locals = define_local_dict.target.id
+        runner = self.intermediate_name_gen()
+        try_callable.args = ast.arguments(
+            posonlyargs=[],
+            args=[ast.arg(param) for param in params],
+            kwonlyargs=[],
+            kw_defaults=[],
+            defaults=[],
+        )
+        hoist.setup += [
+            ast.NamedExpr(
+                target=ast.Name(id=intermediate_locals, ctx=ast.Store()),
+                value=ast.Dict(keys=[], values=[]),
+            ),
+            ast.NamedExpr(
+                target=ast.Name(id=runner, ctx=ast.Store()),
+                value=ast.Call(func=ctx_mgr, args=[try_callable], keywords=[]),
+            ),
+        ]
+        # The dict keeps what the previous iteration assigned in the try, like the variables
+        # themselves would
+        refresh = [
+            ast.Call(
+                func=ast.Attribute(
+                    value=ast.Name(id=intermediate_locals, ctx=ast.Load()),
+                    attr="update",
+                    ctx=ast.Load(),
+                ),
+                args=[],
+                keywords=define_local_dict.value.keywords,
+            )
+        ]
+        return ast.Subscript(
+            value=ast.Tuple(
+                elts=[
+                    *(refresh if define_local_dict.value.keywords else []),
+                    ast.Call(
+                        func=ast.Name(id=runner, ctx=ast.Load()),
+                        args=[ast.Name(id=param, ctx=ast.Load()) for param in params],
+                        keywords=[],
+                    ),
+                    self.reassign_Locals(
+                        intermediate_locals,
+                        [
+                            var
+                            for var in self.scopes.current_scope().vars
+                            if var.id in assigned
+                        ],
+                    ),
+                    self.get_Locals(
+                        ast.Name(id=intermediate_name, ctx=ast.Load()),
+                        intermediate_locals,
+                    ),
+                ],
+                ctx=ast.Load(),
             ),
             slice=ast.Constant(value=-1),
             ctx=ast.Load(),
         )
 
     def visit_Continue(self, node):
-        raise ExprifyException("Exprify does not support 'continue'")
+        if not self.loop_controls or not self.loop_controls[-1]:
+            raise ExprifyException("'continue' outside of a loop")
+        return self.set_loop_control(self.loop_controls[-1], CONTINUE)
 
     def visit_Break(self, node):
-        raise ExprifyException("Exprify does not support 'break'")
+        if not self.loop_controls or not self.loop_controls[-1]:
+            raise ExprifyException("'break' outside of a loop")
+        return self.set_loop_control(self.loop_controls[-1], BREAK)
 
     def visit_Yield(self, node):
-        raise ExprifyException("Exprify does not support 'yield'")
+        # Statements that yield are lowered by map_generator_body, this is a yield anywhere else
+        raise ExprifyException(
+            "Exprify only supports 'yield' as a statement in a function body, loop or if"
+        )
 
     def visit_YieldFrom(self, node):
-        raise ExprifyException("Exprify does not support 'yield'")
+        raise ExprifyException(
+            "Exprify only supports 'yield from' as a statement in a function body, loop or if"
+        )
 
     def visit_Delete(self, node):
         raise ExprifyException("Exprify does not support 'del'")
@@ -631,14 +1401,75 @@ class StatementMapper(ast.NodeTransformer):
     def visit_TryStar(self, node):
         raise ExprifyException("Exprify does not support 'try'")
 
-    def visit_AsyncFunctionDef(self, node):
-        raise ExprifyException("Exprify does not support async")
-
     def visit_AsyncWith(self, node):
-        raise ExprifyException("Exprify does not support async")
+        # Like visit_With, but awaiting __aenter__ and __aexit__. Each manager is bound to a name
+        # so that its __aexit__ is looked up on the same object, and the managers exit in
+        # reverse order.
+        enters, exits = [], []
+        for ctx_manager in node.items:
+            manager = self.intermediate_name_gen()
+            enter = ast.Await(
+                value=ast.Call(
+                    func=ast.Call(
+                        func=ast.Name(id="getattr", ctx=ast.Load()),
+                        args=[
+                            ast.NamedExpr(
+                                target=ast.Name(id=manager, ctx=ast.Store()),
+                                value=ctx_manager.context_expr,
+                            ),
+                            ast.Constant(value="__aenter__"),
+                        ],
+                        keywords=[],
+                    ),
+                    args=[],
+                    keywords=[],
+                )
+            )
+            if ctx_manager.optional_vars:
+                enter = ast.NamedExpr(target=ctx_manager.optional_vars, value=enter)
+            enters.append(enter)
+            exits.insert(
+                0,
+                ast.Await(
+                    value=ast.Call(
+                        func=ast.Call(
+                            func=ast.Name(id="getattr", ctx=ast.Load()),
+                            args=[
+                                ast.Name(id=manager, ctx=ast.Load()),
+                                ast.Constant(value="__aexit__"),
+                            ],
+                            keywords=[],
+                        ),
+                        args=[ast.Constant(value=None)] * 3,
+                        keywords=[],
+                    )
+                ),
+            )
+        return ast.Subscript(
+            value=ast.Tuple(
+                elts=enters + [self.map_body(node)] + exits, ctx=ast.Load()
+            ),
+            slice=ast.Constant(value=len(enters)),
+            ctx=ast.Load(),
+        )
 
     def visit_AsyncFor(self, node):
-        raise ExprifyException("Exprify does not support async")
+        # An async comprehension. With a break, aB stops taking items from the iterable once
+        # the loop is broken out of, as zip can't iterate asynchronously.
+        jumps = find_jumps(node.body)
+        control = self.intermediate_name_gen() if jumps else None
+        iterator = node.iter
+        if ast.Break in jumps:
+            self.required_injects.add(Injected.ASYNC_BREAK)
+            iterator = ast.Call(
+                func=ast.Name(id="aB", ctx=ast.Load()),
+                args=[iterator, ast.Name(id=control, ctx=ast.Load())],
+                keywords=[],
+            )
+        setup = [self.new_loop_control(control)] if control else []
+        return self.lower_loop(
+            node, node.target, iterator, control, setup, is_async=True
+        )
 
     def visit_Nonlocal(self, node):
         raise ExprifyException("Exprify does not support nonlocal")
@@ -0,0 +1,102 @@
+import os
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+
+from .reflow import reflow, best_reflow, LAYOUT_TIME_BUDGET, TOLERANCE
+from .transpile import transpile_script_source
+from .ast_transformer import TranspileOptions
+
+
+@dataclass
+class BatchResult:
+    source: Path
+    output: Path
+    error: str | None = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def collect_sources(paths, out_dir):
+    # Files are written directly into out_dir, directories are mirrored underneath it
+    out_dir = Path(out_dir)
+    for path in map(Path, paths):
+        if path.is_dir():
+            for source in sorted(path.rglob("*.py")):
+                yield source, out_dir / source.relative_to(path)
+        else:
+            yield path, out_dir / path.name
+
+
+def transpile_file(
+    source,
+    output,
+    outline=None,
+    tolerance=TOLERANCE,
+    options=TranspileOptions(),
+    layout="greedy",
+    time_budget=LAYOUT_TIME_BUDGET,
+):
+    try:
+        script = Path(source).read_text()
+        if outline is not None and tolerance == "auto":
+            # Files are already processed in parallel, so sweep tolerances serially
+            result = best_reflow(
+                script,
+                outline,
+                layout=layout,
+                time_budget=time_budget,
+                jobs=1,
+                options=options,
+            ).text
+        elif outline is not None:
+            result = reflow(script, outline, tolerance, layout, time_budget, options)
+        else:
+            result = transpile_script_source(script, options)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(result + "\n")
+    except Exception as e:
+        return BatchResult(source, output, f"{type(e).__name__}: {e}")
+    return BatchResult(source, output)
+
+
+def transpile_tree(
+    paths,
+    out_dir,
+    outline=None,
+    tolerance=TOLERANCE,
+    jobs=None,
+    options=TranspileOptions(),
+    layout="greedy",
+    time_budget=LAYOUT_TIME_BUDGET,
+):
+    jobs = jobs or os.cpu_count() or 1
+    sources = list(collect_sources(paths, out_dir))
+    # Inputs that would be written to the same output, like a/x.py and b/x.py, all fail rather
+    # than overwriting each other
+    claims = Counter(output.resolve() for _, output in sources)
+    collisions = {
+        source: BatchResult(
+            source, output, f"Output {output} would also be written for another input"
+        )
+        for source, output in sources
+        if claims[output.resolve()] > 1
+    }
+    args = [
+        (source, output, outline, tolerance, options, layout, time_budget)
+        for source, output in sources
+        if source not in collisions
+    ]
+    if jobs == 1 or len(args) <= 1:
+        results = [transpile_file(*a) for a in args]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Spread files round-robin in largish chunks so the pool isn't dominated by IPC overhead
+        chunksize = max(1, len(args) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(transpile_file, *zip(*args), chunksize=chunksize))
+    results = iter(results)
+    return [collisions.get(source) or next(results) for source, _ in sources]
@@ -0,0 +1,197 @@
+import functools
+import marshal
+import os
+import sys
+from pathlib import Path
+
+# Set EXPRIFY_NO_CACHE to any non-empty value to bypass the cache entirely.
+CACHE_DISABLE_ENV = "EXPRIFY_NO_CACHE"
+CACHE_DIR_ENV = "EXPRIFY_CACHE_DIR"
+CACHE_SIZE_ENV = "EXPRIFY_CACHE_SIZE"
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+CACHE_SUFFIX = ".pickle"
+CODE_SUFFIX = ".exprify.pyc"
+
+# How many bytes each cache directory this process writes to is thought to hold, so that a
+# write only scans the directory once the entries may have outgrown the cache size
+directory_sizes = {}
+
+
+def cache_enabled():
+    return not os.environ.get(CACHE_DISABLE_ENV)
+
+
+def cache_dir():
+    if path := os.environ.get(CACHE_DIR_ENV):
+        return Path(path)
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "exprify"
+
+
+def cache_size():
+    return int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+
+
+@functools.cache
+def fingerprint():
+    # Entries must be invalidated whenever exprify itself changes, and the version number alone
+    # is not bumped for every change, so the package's own sources are hashed in as well.
+    # importlib.metadata is slow to import, so it's only imported once a key is needed.
+    from importlib import metadata
+    import hashlib
+
+    try:
+        version = metadata.version("exprify")
+    except metadata.PackageNotFoundError:
+        version = "unknown"
+    h = hashlib.sha256(f"{version}:{sys.version}".encode())
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+@functools.cache
+def source_stamp():
+    # A cheaper stand-in for fingerprint(), for entries that are read while a program starts.
+    # The package's sources are identified by their size and modification time, not hashed.
+    import hashlib
+
+    h = hashlib.sha256(f"{sys.version}:{sys.implementation.cache_tag}".encode())
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        stat = path.stat()
+        h.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+
+def cache_key(stage, *parts):
+    import hashlib
+
+    h = hashlib.sha256(f"{fingerprint()}:{stage}".encode())
+    for part in parts:
+        h.update(b"\0")
+        h.update(part.encode() if isinstance(part, str) else repr(part).encode())
+    return h.hexdigest()
+
+
+def cached(stage, compute, *parts):
+    # Return the stored result of `stage` for these inputs, or compute and store it.
+    if not cache_enabled():
+        return compute()
+    # pickle and tempfile are only imported once the cache is used, to keep `import exprify` fast
+    import pickle
+    import tempfile
+
+    directory = cache_dir()
+    path = directory / (cache_key(stage, *parts) + CACHE_SUFFIX)
+    try:
+        with open(path, "rb") as f:
+            result = pickle.load(f)
+        # Touch the entry so eviction sees it as recently used
+        os.utime(path)
+        return result
+    except FileNotFoundError:
+        pass
+    except Exception:
+        # Unpickling a corrupt or foreign entry can raise nearly anything. The entry is dropped
+        # and computed again, as a cache must never fail where computing wouldn't.
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    result = compute()
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = f.tell()
+        os.replace(tmp, path)
+        record_write(directory, size, cache_size())
+    except OSError:
+        pass
+    return result
+
+
+def code_path(filename, name, *parts):
+    # Where a code object compiled from a function in `filename` is kept, in the __pycache__
+    # directory next to it like the interpreter's own bytecode
+    import hashlib
+
+    path = Path(filename)
+    h = hashlib.sha256(source_stamp().encode())
+    for part in parts:
+        h.update(b"\0")
+        h.update(part if isinstance(part, bytes) else repr(part).encode())
+    return (
+        path.parent
+        / "__pycache__"
+        / f"{path.stem}.{name}.{h.hexdigest()[:16]}{CODE_SUFFIX}"
+    )
+
+
+def load_code(path):
+    try:
+        with open(path, "rb") as f:
+            code = marshal.load(f)
+        os.utime(path)
+        return code
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def store_code(path, code):
+    # The entries in each __pycache__ directory are kept within the cache size, like the cache
+    import tempfile
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump(code, f)
+            size = f.tell()
+        os.replace(tmp, path)
+        record_write(path.parent, size, cache_size(), CODE_SUFFIX)
+    except OSError:
+        pass
+
+
+def record_write(directory, size, max_size, suffix=CACHE_SUFFIX):
+    # The first write to a directory scans it, and later ones only add to its size until it
+    # exceeds max_size. Entries written by other processes are counted at the next eviction.
+    total = directory_sizes.get(directory)
+    if total is None or total + size > max_size:
+        total = evict(directory, max_size, suffix)
+    else:
+        total += size
+    directory_sizes[directory] = total
+
+
+def evict(directory, max_size, suffix=CACHE_SUFFIX):
+    # Remove least recently used entries until the cache fits in max_size bytes, and return the
+    # size of what is left. Only files ending in suffix are entries.
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(suffix):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+    return total
+
+
+def clear():
+    directory = cache_dir()
+    directory_sizes.pop(directory, None)
+    if directory.is_dir():
+        evict(directory, 0)
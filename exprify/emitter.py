@@ -0,0 +1,553 @@
+import ast
+import io
+from enum import IntEnum, auto
+from tokenize import (
+    ENDMARKER,
+    NAME,
+    NEWLINE,
+    NUMBER,
+    OP,
+    STRING,
+    TokenInfo,
+    tokenize,
+)
+
+from .ast_transformer import ExprifyException
+
+
+class Precedence(IntEnum):
+    NAMED_EXPR = auto()
+    TUPLE = auto()
+    YIELD = auto()
+    TEST = auto()
+    OR = auto()
+    AND = auto()
+    NOT = auto()
+    CMP = auto()
+    EXPR = auto()
+    BOR = EXPR
+    BXOR = auto()
+    BAND = auto()
+    SHIFT = auto()
+    ARITH = auto()
+    TERM = auto()
+    FACTOR = auto()
+    POWER = auto()
+    AWAIT = auto()
+    ATOM = auto()
+
+    def next(self):
+        return Precedence(self + 1)
+
+
+BINOPS = {
+    ast.Add: ("+", Precedence.ARITH),
+    ast.Sub: ("-", Precedence.ARITH),
+    ast.Mult: ("*", Precedence.TERM),
+    ast.MatMult: ("@", Precedence.TERM),
+    ast.Div: ("/", Precedence.TERM),
+    ast.Mod: ("%", Precedence.TERM),
+    ast.FloorDiv: ("//", Precedence.TERM),
+    ast.Pow: ("**", Precedence.POWER),
+    ast.LShift: ("<<", Precedence.SHIFT),
+    ast.RShift: (">>", Precedence.SHIFT),
+    ast.BitOr: ("|", Precedence.BOR),
+    ast.BitXor: ("^", Precedence.BXOR),
+    ast.BitAnd: ("&", Precedence.BAND),
+}
+UNARYOPS = {
+    ast.Not: ("not", Precedence.NOT),
+    ast.Invert: ("~", Precedence.FACTOR),
+    ast.UAdd: ("+", Precedence.FACTOR),
+    ast.USub: ("-", Precedence.FACTOR),
+}
+CMPOPS = {
+    ast.Eq: ("==",),
+    ast.NotEq: ("!=",),
+    ast.Lt: ("<",),
+    ast.LtE: ("<=",),
+    ast.Gt: (">",),
+    ast.GtE: (">=",),
+    ast.Is: ("is",),
+    ast.IsNot: ("is", "not"),
+    ast.In: ("in",),
+    ast.NotIn: ("not", "in"),
+}
+BOOLOPS = {
+    ast.And: ("and", Precedence.AND),
+    ast.Or: ("or", Precedence.OR),
+}
+
+
+def source_tokens(source):
+    # Tokenize a snippet of source the way reflow expects, without the ENCODING and ENDMARKER tokens
+    from .reflow import merge_fstring_literals
+
+    _, *tokens = tokenize(io.BytesIO(source.encode("utf-8")).readline)
+    return [
+        tok
+        for tok in merge_fstring_literals(tokens)
+        if tok.type not in (ENDMARKER, NEWLINE)
+    ]
+
+
+class TokenEmitter(ast.NodeVisitor):
+    # Emits the tokens of a transpiled module directly from its AST, parenthesizing only where
+    # the grammar requires it. f-strings are emitted as single STRING tokens, the same way
+    # merge_fstring_literals presents them. Any node without a dedicated emitter falls back to
+    # tokenizing the output of ast.unparse.
+    def __init__(self):
+        self.tokens = []
+        self.precedences = {}
+        self.visitors = {}
+
+    def visit(self, node):
+        # NodeVisitor looks the method up by name on every call, which adds up on big trees
+        kind = type(node)
+        method = self.visitors.get(kind)
+        if method is None:
+            method = getattr(type(self), "visit_" + kind.__name__, None)
+            method = self.visitors[kind] = method or type(self).generic_visit
+        return method(self, node)
+
+    def emit(self, type, string):
+        self.tokens.append(TokenInfo(type, string, (0, 0), (0, 0), ""))
+
+    def op(self, string):
+        self.emit(OP, string)
+
+    def name(self, string):
+        self.emit(NAME, string)
+
+    def expr(self, node, precedence=Precedence.TEST):
+        self.precedences[node] = precedence
+        self.visit(node)
+
+    def parens(self, node, own, visit):
+        # Run visit wrapped in parentheses if the node binds looser than its context requires
+        needed = self.precedences.get(node, Precedence.TEST) > own
+        if needed:
+            self.op("(")
+        visit()
+        if needed:
+            self.op(")")
+
+    def interleave(self, items, emit, separator=","):
+        for i, item in enumerate(items):
+            if i:
+                self.op(separator)
+            emit(item)
+
+    def generic_visit(self, node):
+        if isinstance(node, ast.stmt):
+            self.unparsed(node)
+            return
+        self.op("(")
+        self.unparsed(node)
+        self.op(")")
+
+    def unparsed(self, node):
+        source = ast.unparse(node)
+        if "\n" in source and isinstance(node, ast.stmt):
+            # Statements left as they are, like a top level match, can't be laid out without
+            # their newlines and indentation
+            raise ExprifyException(
+                f"Exprify can't reflow '{type(node).__name__.lower()}' statements"
+            )
+        for tok in source_tokens(source):
+            self.emit(tok.type, tok.string)
+
+    # Statements
+
+    def visit_Module(self, node):
+        for stmt in node.body:
+            self.visit(stmt)
+            self.emit(NEWLINE, "\n")
+        self.emit(ENDMARKER, "")
+
+    def visit_Expr(self, node):
+        # transpile() wraps every top level node in an Expr, including statements that were
+        # left alone, and the lowering can leave Exprs nested inside expressions.
+        if isinstance(node.value, ast.stmt):
+            return self.visit(node.value)
+        self.expr(node.value, max(self.precedences.get(node, 0), Precedence.YIELD))
+
+    def visit_Assign(self, node):
+        for target in node.targets:
+            self.expr(target, Precedence.TUPLE)
+            self.op("=")
+        self.expr(node.value, Precedence.YIELD)
+
+    def visit_Assert(self, node):
+        self.name("assert")
+        self.expr(node.test)
+        if node.msg:
+            self.op(",")
+            self.expr(node.msg)
+
+    # Expressions
+
+    def visit_Name(self, node):
+        self.name(node.id)
+
+    def visit_Constant(self, node):
+        value = node.value
+        if value is None or value is True or value is False:
+            self.name(repr(value))
+        elif value is ...:
+            self.op("...")
+        elif isinstance(value, (str, bytes)):
+            self.emit(STRING, repr(value))
+        elif isinstance(value, int) or (
+            isinstance(value, float) and repr(value) not in ("inf", "nan")
+        ):
+            self.emit(NUMBER, repr(value))
+        else:
+            # Infinities, nans and complex numbers need expressions to spell them
+            self.generic_visit(node)
+
+    def visit_JoinedStr(self, node):
+        self.emit(STRING, ast.unparse(node))
+
+    def visit_NamedExpr(self, node):
+        def visit():
+            self.expr(node.target, Precedence.ATOM)
+            self.op(":=")
+            self.expr(node.value, Precedence.TEST)
+
+        self.parens(node, Precedence.NAMED_EXPR, visit)
+
+    def visit_Tuple(self, node):
+        self.op("(")
+        self.elements(node.elts)
+        if len(node.elts) == 1:
+            self.op(",")
+        self.op(")")
+
+    def elements(self, elts):
+        self.interleave(elts, lambda e: self.expr(e, Precedence.NAMED_EXPR))
+
+    def visit_List(self, node):
+        self.op("[")
+        self.elements(node.elts)
+        self.op("]")
+
+    def visit_Set(self, node):
+        if not node.elts:
+            # There is no literal for an empty set
+            self.op("{")
+            self.op("*")
+            self.op("(")
+            self.op(")")
+            self.op("}")
+            return
+        self.op("{")
+        self.elements(node.elts)
+        self.op("}")
+
+    def visit_Dict(self, node):
+        def item(pair):
+            key, value = pair
+            if key is None:
+                self.op("**")
+                self.expr(value, Precedence.EXPR)
+            else:
+                self.expr(key)
+                self.op(":")
+                self.expr(value)
+
+        self.op("{")
+        self.interleave(list(zip(node.keys, node.values)), item)
+        self.op("}")
+
+    def visit_Starred(self, node):
+        self.op("*")
+        self.expr(node.value, Precedence.EXPR)
+
+    def visit_Attribute(self, node):
+        value = node.value
+        # `1.real` would be read as a float followed by a name
+        if isinstance(value, ast.Constant) and isinstance(value.value, int):
+            self.op("(")
+            self.visit(value)
+            self.op(")")
+        else:
+            self.expr(value, Precedence.ATOM)
+        self.op(".")
+        self.name(node.attr)
+
+    def visit_Subscript(self, node):
+        self.expr(node.value, Precedence.ATOM)
+        self.op("[")
+        if isinstance(node.slice, ast.Tuple) and node.slice.elts:
+            self.interleave(node.slice.elts, self.visit_slice_element)
+            if len(node.slice.elts) == 1:
+                self.op(",")
+        else:
+            self.visit_slice_element(node.slice)
+        self.op("]")
+
+    def visit_slice_element(self, node):
+        if isinstance(node, ast.Slice):
+            return self.visit(node)
+        self.expr(node, Precedence.NAMED_EXPR)
+
+    def visit_Slice(self, node):
+        if node.lower:
+            self.expr(node.lower)
+        self.op(":")
+        if node.upper:
+            self.expr(node.upper)
+        if node.step:
+            self.op(":")
+            self.expr(node.step)
+
+    def visit_Call(self, node):
+        self.expr(node.func, Precedence.ATOM)
+        self.op("(")
+        if (
+            len(node.args) == 1
+            and not node.keywords
+            and isinstance(node.args[0], ast.GeneratorExp)
+        ):
+            # A lone generator argument doesn't need its own parentheses
+            self.comprehension_body(node.args[0].elt, node.args[0].generators)
+        else:
+            self.interleave(
+                [*node.args, *node.keywords],
+                lambda a: self.visit(a)
+                if isinstance(a, ast.keyword)
+                else self.expr(a, Precedence.NAMED_EXPR),
+            )
+        self.op(")")
+
+    def visit_keyword(self, node):
+        if node.arg is None:
+            self.op("**")
+            self.expr(node.value, Precedence.EXPR)
+        else:
+            self.name(node.arg)
+            self.op("=")
+            self.expr(node.value)
+
+    def visit_BinOp(self, node):
+        operator, own = BINOPS[type(node.op)]
+        # Power is right associative, everything else is left associative
+        if isinstance(node.op, ast.Pow):
+            left, right = Precedence.AWAIT, Precedence.FACTOR
+        else:
+            left, right = own, own.next()
+
+        def visit():
+            self.expr(node.left, left)
+            self.op(operator)
+            self.expr(node.right, right)
+
+        self.parens(node, own, visit)
+
+    def visit_UnaryOp(self, node):
+        operator, own = UNARYOPS[type(node.op)]
+
+        def visit():
+            if isinstance(node.op, ast.Not):
+                self.name(operator)
+            else:
+                self.op(operator)
+            self.expr(node.operand, own)
+
+        self.parens(node, own, visit)
+
+    def visit_BoolOp(self, node):
+        operator, own = BOOLOPS[type(node.op)]
+
+        # interleave emits OP separators, so the keyword is inserted by hand here
+        def visit():
+            for i, value in enumerate(node.values):
+                if i:
+                    self.name(operator)
+                self.expr(value, own.next())
+
+        self.parens(node, own, visit)
+
+    def visit_Compare(self, node):
+        def visit():
+            self.expr(node.left, Precedence.CMP.next())
+            for op, comparator in zip(node.ops, node.comparators):
+                for part in CMPOPS[type(op)]:
+                    if part.isalpha():
+                        self.name(part)
+                    else:
+                        self.op(part)
+                self.expr(comparator, Precedence.CMP.next())
+
+        self.parens(node, Precedence.CMP, visit)
+
+    def visit_IfExp(self, node):
+        def visit():
+            self.expr(node.body, Precedence.TEST.next())
+            self.name("if")
+            self.expr(node.test, Precedence.TEST.next())
+            self.name("else")
+            self.expr(node.orelse, Precedence.TEST)
+
+        self.parens(node, Precedence.TEST, visit)
+
+    def visit_Lambda(self, node):
+        def visit():
+            self.name("lambda")
+            self.visit(node.args)
+            self.op(":")
+            self.expr(node.body, Precedence.TEST)
+
+        self.parens(node, Precedence.TEST, visit)
+
+    def visit_arguments(self, node):
+        params = []
+        positional = [*node.posonlyargs, *node.args]
+        defaults = [None] * (len(positional) - len(node.defaults)) + node.defaults
+        for i, (arg, default) in enumerate(zip(positional, defaults), 1):
+            params.append((arg.arg, default))
+            if i == len(node.posonlyargs):
+                params.append(("/", None))
+        if node.vararg:
+            params.append(("*" + node.vararg.arg, None))
+        elif node.kwonlyargs:
+            params.append(("*", None))
+        for arg, default in zip(node.kwonlyargs, node.kw_defaults):
+            params.append((arg.arg, default))
+        if node.kwarg:
+            params.append(("**" + node.kwarg.arg, None))
+
+        def param(item):
+            name, default = item
+            if name.startswith("*") or name == "/":
+                self.op(name[:2] if name.startswith("**") else name[:1])
+                name = name.lstrip("*/")
+            if name:
+                self.name(name)
+            if default is not None:
+                self.op("=")
+                self.expr(default)
+
+        self.interleave(params, param)
+
+    def comprehension_body(self, elt, generators, value=None):
+        if value is None:
+            self.expr(elt, Precedence.NAMED_EXPR)
+        else:
+            self.expr(elt)
+            self.op(":")
+            self.expr(value)
+        for generator in generators:
+            self.visit(generator)
+
+    def visit_comprehension(self, node):
+        if node.is_async:
+            self.name("async")
+        self.name("for")
+        if isinstance(node.target, ast.Tuple) and node.target.elts:
+            self.interleave(
+                node.target.elts, lambda t: self.expr(t, Precedence.TUPLE.next())
+            )
+            if len(node.target.elts) == 1:
+                self.op(",")
+        else:
+            self.expr(node.target, Precedence.TUPLE)
+        self.name("in")
+        self.expr(node.iter, Precedence.TEST.next())
+        for condition in node.ifs:
+            self.name("if")
+            self.expr(condition, Precedence.TEST.next())
+
+    def visit_ListComp(self, node):
+        self.op("[")
+        self.comprehension_body(node.elt, node.generators)
+        self.op("]")
+
+    def visit_SetComp(self, node):
+        self.op("{")
+        self.comprehension_body(node.elt, node.generators)
+        self.op("}")
+
+    def visit_DictComp(self, node):
+        self.op("{")
+        self.comprehension_body(node.key, node.generators, node.value)
+        self.op("}")
+
+    def visit_GeneratorExp(self, node):
+        self.op("(")
+        self.comprehension_body(node.elt, node.generators)
+        self.op(")")
+
+    def visit_Await(self, node):
+        def visit():
+            self.name("await")
+            self.expr(node.value, Precedence.ATOM)
+
+        self.parens(node, Precedence.AWAIT, visit)
+
+    def visit_Yield(self, node):
+        def visit():
+            self.name("yield")
+            if node.value:
+                self.expr(node.value, Precedence.YIELD)
+
+        self.parens(node, Precedence.YIELD, visit)
+
+    def visit_YieldFrom(self, node):
+        def visit():
+            self.name("yield")
+            self.name("from")
+            self.expr(node.value, Precedence.YIELD)
+
+        self.parens(node, Precedence.YIELD, visit)
+
+
+class SourceEmitter(TokenEmitter):
+    # Writes compact source straight into a buffer instead of collecting tokens. Parentheses are
+    # already minimal, and a space is only written between two tokens that would otherwise run
+    # together into one, like `else 0` or `in b''`.
+    def __init__(self):
+        super().__init__()
+        self.buffer = []
+        # Whether the last token ended in an identifier character
+        self.spaced = False
+
+    def emit(self, type, string):
+        if type == NEWLINE:
+            string = "\n"
+        elif self.spaced and (type in (NAME, NUMBER) or string[:1].isalpha()):
+            self.buffer.append(" ")
+        self.buffer.append(string)
+        self.spaced = type in (NAME, NUMBER)
+
+    def op(self, string):
+        self.buffer.append(string)
+        self.spaced = False
+
+    def name(self, string):
+        if self.spaced:
+            self.buffer.append(" ")
+        self.buffer.append(string)
+        self.spaced = True
+
+    def unparsed(self, node):
+        # Statements left as they are are written out whole, keeping their own newlines and
+        # indentation. They always start a line.
+        if isinstance(node, ast.stmt):
+            self.buffer.append(ast.unparse(node))
+            self.spaced = False
+            return
+        super().unparsed(node)
+
+
+def emit_tokens(tree):
+    emitter = TokenEmitter()
+    emitter.visit(tree)
+    return emitter.tokens
+
+
+def emit_source(tree):
+    emitter = SourceEmitter()
+    emitter.visit(tree)
+    return "".join(emitter.buffer).removesuffix("\n")
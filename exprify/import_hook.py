@@ -0,0 +1,101 @@
+import functools
+import marshal
+import sys
+from importlib.machinery import PathFinder, SourceFileLoader
+from importlib.util import MAGIC_NUMBER, cache_from_source, decode_source
+
+from .ast_transformer import TranspileOptions
+from .cache import source_stamp
+from .transpile import transpile
+
+
+class ExprifyLoader(SourceFileLoader):
+    # Loads a module from its transpiled source. The compiled result is cached next to the
+    # interpreter's own bytecode, as an "opt-exprify" .pyc whose header has the source's mtime
+    # and size, so a warm import only has to stat the source and unmarshal the code.
+    def __init__(self, fullname, path, options, optimization):
+        super().__init__(fullname, path)
+        self.options = options
+        self.optimization = optimization
+
+    def cache_header(self, source_path):
+        stats = self.path_stats(source_path)
+        return b"".join(
+            [
+                MAGIC_NUMBER,
+                (0).to_bytes(4, "little"),
+                (int(stats["mtime"]) & 0xFFFFFFFF).to_bytes(4, "little"),
+                (stats["size"] & 0xFFFFFFFF).to_bytes(4, "little"),
+            ]
+        )
+
+    def get_code(self, fullname):
+        source_path = self.get_filename(fullname)
+        cache_path = cache_from_source(source_path, optimization=self.optimization)
+        header = self.cache_header(source_path)
+        try:
+            data = self.get_data(cache_path)
+        except OSError:
+            pass
+        else:
+            if data[: len(header)] == header:
+                try:
+                    return marshal.loads(memoryview(data)[len(header) :])
+                except (EOFError, ValueError, TypeError):
+                    pass
+        code = self.source_to_code(self.get_data(source_path), source_path)
+        if not sys.dont_write_bytecode:
+            self.set_data(cache_path, header + marshal.dumps(code))
+        return code
+
+    def source_to_code(self, data, path, *, _optimize=-1):
+        tree = transpile(decode_source(data), self.options)
+        return compile(tree, path, "exec", dont_inherit=True, optimize=_optimize)
+
+
+class ExprifyFinder:
+    # Finds the opted-in packages and modules on sys.path like the default path finder, but
+    # loads their sources with ExprifyLoader
+    def __init__(self, names, options=TranspileOptions()):
+        self.names = tuple(names)
+        self.options = options
+
+    @functools.cached_property
+    def optimization(self):
+        # Cache entries are also keyed by the options and exprify's own sources
+        import hashlib
+
+        key = hashlib.sha256(f"{source_stamp()}:{self.options!r}".encode()).hexdigest()
+        return f"exprify{key[:16]}"
+
+    def opted_in(self, fullname):
+        return any(
+            fullname == name or fullname.startswith(name + ".") for name in self.names
+        )
+
+    def find_spec(self, fullname, path=None, target=None):
+        if not self.opted_in(fullname):
+            return None
+        spec = PathFinder.find_spec(fullname, path, target)
+        if spec is None or not isinstance(spec.loader, SourceFileLoader):
+            return spec
+        spec.loader = ExprifyLoader(
+            fullname, spec.origin, self.options, self.optimization
+        )
+        spec.cached = cache_from_source(spec.origin, optimization=self.optimization)
+        return spec
+
+    def invalidate_caches(self):
+        PathFinder.invalidate_caches()
+
+
+def install_import_hook(*names, options=TranspileOptions()):
+    # Transpiles the named packages and modules, and everything inside them, as they are
+    # imported from now on. Returns the finder, to be passed to uninstall_import_hook.
+    finder = ExprifyFinder(names, options)
+    sys.meta_path.insert(0, finder)
+    return finder
+
+
+def uninstall_import_hook(finder):
+    sys.meta_path.remove(finder)
@@ -0,0 +1,171 @@
+import ast
+import copy
+import functools
+import os
+import time
+from dataclasses import dataclass
+
+from .ast_transformer import StatementMapper, TranspileOptions, walk_function
+from .emitter import emit_source
+from .transpile import injections
+
+WATCH_INTERVAL = 0.05
+# Lines at the start of a line that continue the statement before them
+CONTINUATIONS = ("else", "elif", "except", "finally")
+
+
+def statement_source(lines, stmt):
+    # The exact source of a top level statement, including its decorators, which is all that
+    # its lowering depends on apart from the variables assigned before it
+    if getattr(stmt, "decorator_list", None):
+        start_line, start_col = min(d.lineno for d in stmt.decorator_list), 0
+    else:
+        start_line, start_col = stmt.lineno, stmt.col_offset
+    if start_line == stmt.end_lineno:
+        return lines[start_line - 1][start_col : stmt.end_col_offset]
+    return "".join(
+        [
+            lines[start_line - 1][start_col:],
+            *lines[start_line : stmt.end_lineno - 1],
+            lines[stmt.end_lineno - 1][: stmt.end_col_offset],
+        ]
+    )
+
+
+def split_chunks(lines):
+    # Splits a script into chunks of whole top level statements, at every line that starts
+    # at the first column. This is only a guess, as a string or a bracket may span such a
+    # line, but then the chunk before it won't parse on its own.
+    chunk = []
+    for line in lines:
+        if (
+            chunk
+            and line[:1] not in ("", " ", "\t", "\n", "#", ")", "]", "}")
+            and not line.startswith(CONTINUATIONS)
+            and not chunk[-1].startswith("@")
+        ):
+            yield "".join(chunk)
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        yield "".join(chunk)
+
+
+def parse_statements(chunk):
+    lines = chunk.splitlines(keepends=True)
+    return [(statement_source(lines, stmt), stmt) for stmt in ast.parse(chunk).body]
+
+
+def uses_variables(stmt):
+    # Only a try outside of any function copies the variables assigned before it
+    return any(isinstance(node, ast.Try) for node in walk_function([stmt]))
+
+
+@functools.cache
+def injections_source(injects, options=TranspileOptions()):
+    return emit_source(ast.Module(body=injections(injects, options), type_ignores=[]))
+
+
+class IncrementalTranspiler:
+    # Transpiles a script one top level statement at a time, keeping what each statement was
+    # lowered to, so that transpiling an edited version of the script only lowers the
+    # statements that changed. Every statement gets its own intermediate names, which is fine
+    # as the intermediates at the top level are only used within their own statement.
+    def __init__(self, options=TranspileOptions()):
+        self.options = options
+        self.lowered = {}
+        self.parsed = {}
+        # How many statements the last call to transpile lowered
+        self.last_lowered = 0
+
+    def parse(self, source):
+        # Only chunks that changed are parsed again
+        parsed, statements = {}, []
+        try:
+            for chunk in split_chunks(source.splitlines(keepends=True)):
+                if chunk not in parsed:
+                    parsed[chunk] = self.parsed.get(chunk) or parse_statements(chunk)
+                statements.extend(parsed[chunk])
+        except SyntaxError:
+            self.parsed = {}
+            return parse_statements(source)
+        self.parsed = parsed
+        return statements
+
+    def lower(self, stmt, variables):
+        # The parsed statement is kept for the next call to transpile, so lower a copy of it.
+        # What it is lowered to must only depend on the statement and the variables it is
+        # given, which are part of its key, so it reports every name it assigns, whether or
+        # not an earlier statement assigned it too.
+        stmt = copy.deepcopy(stmt)
+        mapper = StatementMapper(self.options)
+        mapper.scopes.current_scope().extend_vars(
+            ast.Name(id=name, ctx=ast.Store()) for name in variables
+        )
+        module = mapper.generic_visit(ast.Module(body=[stmt], type_ignores=[]))
+        module.body = [
+            node if isinstance(node, ast.stmt) else ast.Expr(value=node)
+            for node in module.body
+        ]
+        assigned = tuple(mapper.scopes.current_scope().variables)
+        return emit_source(module), frozenset(mapper.required_injects), assigned
+
+    def transpile(self, source):
+        variables = {}
+        lowered, statements, injects = {}, [], set()
+        self.last_lowered = 0
+        for segment, stmt in self.parse(source):
+            key = (segment, tuple(variables) if uses_variables(stmt) else ())
+            entry = lowered.get(key) or self.lowered.get(key)
+            if entry is None:
+                entry = self.lower(stmt, key[1])
+                self.last_lowered += 1
+            lowered[key] = entry
+            statement, required, assigned = entry
+            statements.append(statement)
+            injects.update(required)
+            variables.update(dict.fromkeys(assigned))
+        # Statements that are no longer in the script are dropped
+        self.lowered = lowered
+        header = injections_source(frozenset(injects), self.options)
+        return "\n".join(([header] if header else []) + statements)
+
+
+@dataclass
+class WatchResult:
+    script: str | None
+    seconds: float
+    lowered: int = 0
+    error: str | None = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def iter_watch(path, options=TranspileOptions(), interval=WATCH_INTERVAL):
+    # Transpiles the file at path every time it changes, and yields the result
+    transpiler = IncrementalTranspiler(options)
+    modified = None
+    while True:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            # Editors that save by renaming a new file over the old one leave it missing for
+            # a moment
+            mtime = modified
+        if mtime != modified:
+            modified = mtime
+            start = time.perf_counter()
+            try:
+                with open(path) as f:
+                    script = transpiler.transpile(f.read())
+            except Exception as e:
+                yield WatchResult(
+                    None, time.perf_counter() - start, error=f"{type(e).__name__}: {e}"
+                )
+            else:
+                yield WatchResult(
+                    script, time.perf_counter() - start, transpiler.last_lowered
+                )
+        time.sleep(interval)
@@ -1,61 +1,185 @@
 from enum import StrEnum
+from pathlib import Path
 import ast
-import inspect
+import functools
 
 
 # ruff: noqa: F841
 class Injected(StrEnum):
     RAISE = "raise"
     EXCEPT = "except"
+    CHAIN = "chain"
+    COROUTINE = "coroutine"
+    ASYNC_BREAK = "async_break"
+
+
+RUNTIME_MODULE = "exprify.runtime"
+# The names that transpiled code refers to, for each injection
+INJECTED_NAMES = {
+    Injected.RAISE: ("rT", "rH", "rC", "rR"),
+    Injected.EXCEPT: ("iEH",),
+    Injected.CHAIN: ("gC",),
+    Injected.COROUTINE: ("aC", "aN"),
+    Injected.ASYNC_BREAK: ("aB",),
+}
 
 
 def raise_func():
+    # rT raises an exception, or an exception class, by throwing it into a generator that is
+    # already closed. No frame runs for that, so the exception is raised where rT is called,
+    # as the object it is and with the traceback it has. rH is `raise exc from cause`, where
+    # setting __cause__ also suppresses the context, as it does for `from None`. Throwing
+    # doesn't set the context, so rC sets it for raises in except clauses, to the exception
+    # the clause handles. rR is a bare raise of the active exception, which fails like Python's
+    # when there is none.
     (
-        rH := lambda exc, cause=None: (
-            copy := type(exc)(*exc.args),
-            setattr(copy, "__cause__", cause) if cause else None,
-            (_ for _ in ()).throw(copy),
-        )
+        rT := (_ for _ in ()).throw,
+        rT.__self__.close(),
+        rC := lambda exc, context: [
+            exc := exc() if isinstance(exc, type) else exc,
+            exc is not context and setattr(exc, "__context__", context),
+            exc,
+        ][-1],
+        rH := lambda exc, cause: rT(
+            [
+                exc := exc() if isinstance(exc, type) else exc,
+                setattr(
+                    exc, "__cause__", cause() if isinstance(cause, type) else cause
+                ),
+            ][0]
+        ),
+        rR := lambda exc: rT(
+            RuntimeError("No active exception to reraise") if exc is None else exc
+        ),
     )
 
 
 def except_func():
+    # iEH runs a try body as a context manager. When the body doesn't raise, only the finally
+    # clause runs. Otherwise the first except clause that catches the exception handles it, as
+    # in Python, and which clause that is gets cached by the exception's type and the types the
+    # clauses catch, so an exception raised over and over in a loop costs a single lookup. Like
+    # Python, a clause only catches the subclasses in an exception's MRO, not classes registered
+    # with an ABC, so what is cached can't go stale.
     (
         ctx_dec := getattr(__import__("contextlib"), "ContextDecorator"),
         iEH := type(
             "iEH",
             ((ctx_dec,)),
             {
+                "dispatch": {},
                 "__init__": lambda iEH, except_handlers={}, final=lambda: None: [
                     setattr(iEH, "except_handlers", except_handlers),
                     setattr(iEH, "final", final),
                 ][-1],
                 "__enter__": lambda iEH: iEH,
-                "__exit__": lambda iEH, exc_type, exc, tb: [
-                    (
-                        handler := (
-                            [
-                                handler
-                                for type, handler in iEH.except_handlers.items()
-                                if issubclass(exc_type, type)
-                            ]
-                        )
-                    ),
-                    ((handler or [lambda *_: None])[0](exc)),
-                    (iEH.final()),
-                    (handler != []),
+                "__exit__": lambda iEH, exc_type, exc, tb: (
+                    (iEH.final(), False)[-1]
+                    if exc_type is None
+                    else [
+                        (key := (exc_type, *iEH.except_handlers)),
+                        (caught := iEH.dispatch.get(key)),
+                        (
+                            caught := (
+                                caught
+                                if caught is not None
+                                else [
+                                    # Types raised are usually few, but they can be made on the fly
+                                    len(iEH.dispatch) > 1024 and iEH.dispatch.clear(),
+                                    iEH.dispatch.setdefault(
+                                        key,
+                                        next(
+                                            (
+                                                type
+                                                for type in iEH.except_handlers
+                                                if type in exc_type.__mro__
+                                            ),
+                                            False,
+                                        ),
+                                    ),
+                                ][-1]
+                            )
+                        ),
+                        (caught is not False and iEH.except_handlers[caught](exc)),
+                        (iEH.final()),
+                        (caught is not False),
+                    ][-1]
+                ),
+            },
+        ),
+    )
+
+
+def chain_func():
+    (gC := getattr(__import__("itertools"), "chain").from_iterable)
+
+
+def coroutine_func():
+    # aC turns the asynchronous generator expression an async function is lowered to into a
+    # coroutine, driving the awaitable returned by anext. The asyncgen hooks are unset while
+    # anext is called, as the event loop would otherwise schedule an aclose for every call.
+    # aN is an awaitable that finishes straight away, for async functions that never await.
+    (
+        get_hooks := getattr(__import__("sys"), "get_asyncgen_hooks"),
+        set_hooks := getattr(__import__("sys"), "set_asyncgen_hooks"),
+        aC := type(
+            "aC",
+            (getattr(__import__("collections.abc").abc, "Coroutine"),),
+            {
+                "__init__": lambda aC, agen: [
+                    hooks := get_hooks(),
+                    set_hooks(None, None),
+                    setattr(aC, "it", anext(agen).__await__()),
+                    set_hooks(*hooks),
+                    setattr(aC, "send", aC.it.send),
+                    setattr(aC, "throw", aC.it.throw),
+                    setattr(aC, "close", aC.it.close),
                 ][-1],
+                "__await__": lambda aC: aC.it,
+                "send": lambda aC, value: aC.it.send(value),
+                "throw": lambda aC, *args: aC.it.throw(*args),
+                "close": lambda aC: aC.it.close(),
             },
         ),
+        aN := type("aN", (), {"__await__": lambda aN: iter(())})(),
+    )
+
+
+def async_break_func():
+    # Stops an async for loop once its control cell reads BREAK, by raising StopAsyncIteration
+    # from __anext__ instead of taking another item
+    (
+        aB := type(
+            "aB",
+            (),
+            {
+                "__init__": lambda aB, iterable, control: [
+                    setattr(aB, "it", aiter(iterable)),
+                    setattr(aB, "control", control),
+                ][-1],
+                "__aiter__": lambda aB: aB,
+                "__anext__": lambda aB: (
+                    (_ for _ in ()).throw(StopAsyncIteration)
+                    if len(aB.control) == 2
+                    else anext(aB.it)
+                ),
+            },
+        )
     )
 
 
-def get_ast_from_func(func):
-    parsed = ast.parse(inspect.getsource(func))
-    return parsed.body[0].body[0]
+@functools.cache
+def injected_asts():
+    # Parsed on first use rather than at import, and all from one read of this module, which
+    # costs far less than inspect.getsource for every function
+    module = ast.parse(Path(__file__).read_text())
+    funcs = {
+        node.name: node.body[0]
+        for node in module.body
+        if isinstance(node, ast.FunctionDef)
+    }
+    return {inject: funcs[f"{inject}_func"] for inject in Injected}
 
 
-injected_ast_objs = {
-    Injected.RAISE: get_ast_from_func(raise_func),
-    Injected.EXCEPT: get_ast_from_func(except_func),
-}
+def injected_ast(inject):
+    return injected_asts()[inject]
@@ -1,27 +1,50 @@
 from sys import version_info
+from bisect import bisect_left, bisect_right
 
 
-from exprify import transpile_script_source
-from itertools import groupby
-from keyword import iskeyword
+from exprify.emitter import emit_tokens
+from exprify.transpile import transpile
+from exprify.ast_transformer import TranspileOptions
+from exprify.cache import cached
+from dataclasses import dataclass
+from itertools import accumulate, groupby, repeat, zip_longest
 from tokenize import (
     NAME,
     STRING,
     NUMBER,
-    tokenize,
     TokenInfo,
 )
 import tokenize as tk
-import io
-import python_minifier
+import functools
+import math
+import time
 
 
 FSTRING_STARTS = ("f'", 'f"')
 BSTRING_STARTS = ("b'", 'b"')
 
 TOLERANCE = 4
+# Tolerances tried when picking the best one automatically
+SWEEP_TOLERANCES = range(0, 10)
 # Make sure that "\\" is at the end, because it has the smallest window
 INVALID_SPLIT_CHARS = {"\\U": 8, "\\u": 4, "\\x": 2, "\\": 1}
+MINIFY_OPTIONS = dict(
+    rename_locals=True,
+    rename_globals=True,
+    hoist_literals=True,
+    remove_annotations=True,
+)
+
+LAYOUTS = ("greedy", "optimal")
+# Settings for the optimal layout search: seconds to spend before falling back to greedy,
+# layouts kept per outline run, and alternatives tried per run from each of them
+LAYOUT_TIME_BUDGET = 5.0
+BEAM_WIDTH = 16
+MAX_VARIANTS = 6
+# Offsets from the end of a run at which string tokens are tried to be split
+SPLIT_OFFSETS = (0, -1, 1, -2, 2, -3, 3)
+# Cost per cell of script that no longer fits in the rest of the outline
+OVERFLOW_PENALTY = 100
 
 
 # Fallback for Python < 3.12
@@ -65,34 +88,82 @@ else:
     FSTRING_END = STRING
 
 
+class SplitIndex:
+    # Where a string token can legally be split, computed once per token string so that
+    # partition_token can answer queries for any column and tolerance without rescanning it.
+    def __init__(self, ts):
+        self.length = len(ts)
+        self.last = {ch: ts.rfind(ch) for ch in INVALID_SPLIT_CHARS}
+        self.colons = [i for i, ch in enumerate(ts) if ch == ":"]
+        # Positions outside of any embedded f-string expression that don't break an escape sequence
+        depth = 0
+        self.splits = []
+        for i, ch in enumerate(ts):
+            if depth == 0 and self.escape_offset(i) == 0:
+                self.splits.append(i)
+            depth += (ch == "{") - (ch == "}")
+        # Where splitting at each position ends up after stepping past escape sequences,
+        # filled in from the right so every step is looked up rather than rescanned.
+        self.past = list(range(self.length + 2 * max(INVALID_SPLIT_CHARS.values())))
+        for i in reversed(range(len(self.past))):
+            if offset := self.escape_offset(i):
+                self.past[i] = self.past_escapes(i + offset)
+
+    def escape_offset(self, splpt):
+        for ch, window in INVALID_SPLIT_CHARS.items():
+            # Equivalent to `ch in ts[splpt - window - 2 :]`
+            start = splpt - window - 2
+            if start < 0:
+                start = max(start + self.length, 0)
+            if self.last[ch] >= start:
+                return window
+        return 0
+
+    def past_escapes(self, splpt):
+        if 0 <= splpt < len(self.past):
+            return self.past[splpt]
+        while (offset := self.escape_offset(splpt)) != 0:
+            splpt += offset
+        return splpt
+
+    def fstring_split_range(self, space, tolerance):
+        # The range start is clamped so it is at minimum 2 to prevent splitting before the f-string identifier.
+        # Nothing at or after a ":" in the range can be split, as it may start a format specifier.
+        lo, hi = max(space - tolerance, 2), min(space + tolerance, self.length - 1)
+        if (c := bisect_left(self.colons, lo)) < len(self.colons):
+            hi = min(hi, self.colons[c] - 1)
+        return bisect_left(self.splits, lo), bisect_right(self.splits, hi)
+
+    def fstring_splits(self, space, tolerance):
+        a, b = self.fstring_split_range(space, tolerance)
+        return [(i, abs(space - i)) for i in self.splits[a:b]]
+
+    def nearest_fstring_split(self, space, tolerance):
+        # The legal split closest to space, preferring the earlier one on ties, or None
+        a, b = self.fstring_split_range(space, tolerance)
+        k = bisect_right(self.splits, space, a, b)
+        nearest = [self.splits[j] for j in (k - 1, k) if a <= j < b]
+        return min(nearest, key=lambda i: abs(space - i), default=None)
+
+
+@functools.lru_cache(maxsize=4096)
+def split_index(ts):
+    return SplitIndex(ts)
+
+
 def poss_fstring_splits(ts, space, tolerance):
     # Generate possible splits that wouldn't break the f-string (not inside of an embedded expression).
-    # The range start is clamped so it is at minimum 2 to prevent splitting before the f-string identifier
-    poss_splits = []
-    format_specifier = False
-    for i in range(max(space - tolerance, 2), space + tolerance + 1):
-        if ts[i] == ":":
-            format_specifier = True
-        if ts[:i].count("{") == ts[:i].count("}") and not format_specifier:
-            format_specifier = False
-            if split_escape_offset(ts, i) == 0:
-                poss_splits.append((i, abs(space - i)))
-    return poss_splits
+    return split_index(ts).fstring_splits(space, tolerance)
 
 
 def split_escape_offset(ts, splpt):
-    for ch, window in INVALID_SPLIT_CHARS.items():
-        if ch in ts[splpt - window - 2 :]:
-            return window
-    return 0
+    return split_index(ts).escape_offset(splpt)
 
 
 def split_mangles_escape(ts, splpt):
     # if we have an escaped char as the last one, we want to go past it
     # keep going until we find a place to split that doesn't break any escaped chars
-    while (offset := split_escape_offset(ts, splpt)) != 0:
-        splpt += offset
-    return splpt
+    return split_index(ts).past_escapes(splpt)
 
 
 def partition_token(tok, space, tolerance):
@@ -104,14 +175,13 @@ def partition_token(tok, space, tolerance):
     if splpt <= 2:
         left, right = ts, ""
     if ts.startswith(FSTRING_STARTS):
-        poss_splits = poss_fstring_splits(ts, space, tolerance)
-        if poss_splits:
-            splpt, _ = min(poss_splits, key=lambda x: x[1])
+        splpt = split_index(ts).nearest_fstring_split(space, tolerance)
+        if splpt is not None:
             left, right = (ts[:splpt] + "'", "f'" + ts[splpt:])
         else:
             left, right = ts, ""
     if ts.startswith(BSTRING_STARTS):
-        if splpt >= len(ts):
+        if splpt < 2 or splpt >= len(ts):
             left, right = ts, ""
         else:
             left, right = (ts[:splpt] + "'", "b'" + ts[splpt:])
@@ -127,93 +197,461 @@ def generate_whitespace_groups(line):
     ]
 
 
-def reflow(script, outline, tolerance=TOLERANCE):
-    # Minify script and then transpile it
-    print(script)
-    script = python_minifier.minify(
-        script,
-        rename_locals=True,
-        rename_globals=True,
-        hoist_literals=True,
-        remove_annotations=True,
+def render_token(tok):
+    # Returns the text a token is laid out as, whether it needs a space after a NAME or NUMBER,
+    # and whether a following NAME or keyword needs a space after it.
+    tok_str = tok.string.strip()
+    match tok.type:
+        case tk.NEWLINE:
+            return tok_str + ";", False, False
+        case tk.NL:
+            return "", False, False
+    # Numbers and prefixed strings like b'' also fuse with a preceding keyword, e.g. `else0`
+    word_like = tok.type in (NAME, NUMBER) or (
+        tok.type == STRING and tok_str[:1].isalpha()
     )
-    script = transpile_script_source(script)
-    old, *token_list = list(tokenize(io.BytesIO(bytes(script, "utf-8")).readline))
-    token_list = merge_fstring_literals(token_list)
-    new_lines = "\n'';\\\n"
-
-    for line in outline.splitlines():
-        line = line.rstrip()
-        cur_line = ""
+    return tok_str, word_like, tok.type in (NAME, NUMBER)
+
+
+class TokenStream:
+    # The token list of a transpiled script, with the lengths and spacing flags that the layout
+    # loop needs precomputed, so that filling the outline is a single pass with a cursor.
+    # Nothing in here is mutated during layout, so one stream can be laid out many times.
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.widths = [len(tok.string.strip()) for tok in tokens]
+        self.rendered = [render_token(tok) for tok in tokens]
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+# The layout cursor is (position in the stream, the unplaced remainder of a split token or None,
+# whether the previously placed token was a NAME or NUMBER).
+START = (0, None, False)
+
+
+def exhausted(stream, cursor):
+    pos, pending, _ = cursor
+    return pending is None and pos >= len(stream)
+
+
+def fill_group(stream, cursor, space, tolerance, line_end=""):
+    # Fill a run of `space` non-whitespace outline cells with tokens starting at `cursor`.
+    # Returns the text for the run, the advanced cursor, and the leftover space which is
+    # negative if the last token overshot the run.
+    pos, pending, prev_spaced = cursor
+    tokens, widths, rendered = stream.tokens, stream.widths, stream.rendered
+    pieces = []
+    last = line_end
+    while space > 0:
+        if pending is None:
+            if pos >= len(tokens):
+                pieces.append("#" * space)
+                space = 0
+                break
+            tok, width = tokens[pos], widths[pos]
+        else:
+            tok = pending
+            width = len(tok.string.strip())
+        if width > space + tolerance:
+            # We can't split NAMEs if they don't have a dot in them
+            if tok.type not in (STRING, NAME, FSTRING_END) or (
+                tok.type == NAME and "." not in tok.string
+            ):
+                # We can't resize, so continue to the next group :(
+                break
+            # If the string is too long, split it up
+            tok, pending = partition_token(tok, space, tolerance)
+            text, word_like, spaced = render_token(tok)
+        elif pending is not None:
+            text, word_like, spaced = render_token(pending)
+            pending = None
+            pos += 1
+        else:
+            text, word_like, spaced = rendered[pos]
+            pos += 1
+
+        # Need to add a space between (NAMES, NUMBERS) and (keywords or NAMES)
+        if word_like and prev_spaced and last and last != " ":
+            text = " " + text
+        prev_spaced = spaced
+        space -= len(text)
+        pieces.append(text)
+        if text:
+            last = text[-1]
+    if space > 0:
+        pieces.insert(1, " " * space)
+        space = 0
+    return "".join(pieces), (pos, pending, prev_spaced), space
+
+
+def layout_lines(stream, outline_lines, tolerance=TOLERANCE):
+    # Yields the laid out text for every line of the outline, which is empty for outline lines
+    # that end up with nothing on them
+    cursor = START
+    for line in outline_lines:
+        parts = []
+        line_end = ""
         carry_over = 0
-        for is_whitespace, space in generate_whitespace_groups(line):
+        for is_whitespace, space in generate_whitespace_groups(line.rstrip()):
             if is_whitespace:
-                cur_line += " " * (space + carry_over)
-            elif not token_list:
-                cur_line += "#" * space
-                carry_over = 0
+                text = " " * (space + carry_over)
             else:
-                new_tokens = []
-                while space > 0:
-                    if not token_list:
-                        cur_line += "".join(new_tokens) + "#" * space
-                        new_tokens = []
-                        space = 0
+                text, cursor, carry_over = fill_group(
+                    stream, cursor, space, tolerance, line_end
+                )
+            if text:
+                parts.append(text)
+                line_end = text[-1]
+        if not exhausted(stream, cursor):
+            parts.append("\\")
+        yield "".join(parts)
+
+
+def reflow_lines(stream, outline_lines, tolerance=TOLERANCE):
+    yield from filter(None, layout_lines(stream, outline_lines, tolerance))
+
+
+def fill_group_variants(
+    stream, cursor, space, tolerance, line_end="", limit=MAX_VARIANTS
+):
+    # Like fill_group, but returns up to `limit` alternative ways of filling the run, with the
+    # greedy one first. The alternatives stop before a token that would overshoot the run, or split
+    # a string at a different point. Each variant also carries how far it deviates from the run.
+    tokens, widths, rendered = stream.tokens, stream.widths, stream.rendered
+    variants = []
+
+    def finish(pieces, cursor, space):
+        deviation = abs(space)
+        if space > 0:
+            pieces = [*pieces[:1], " " * space, *pieces[1:]]
+            space = 0
+        variants.append(("".join(pieces), cursor, space, deviation))
+
+    def search(pos, pending, prev_spaced, space, pieces, last):
+        if len(variants) >= limit:
+            return
+        if space <= 0:
+            return finish(pieces, (pos, pending, prev_spaced), space)
+        if pending is None:
+            if pos >= len(tokens):
+                return variants.append(
+                    ("".join(pieces) + "#" * space, (pos, pending, prev_spaced), 0, 0)
+                )
+            tok, width = tokens[pos], widths[pos]
+        else:
+            tok, width = pending, len(pending.string.strip())
+
+        def place(rendering, pos, pending):
+            text, word_like, spaced = rendering
+            if word_like and prev_spaced and last and last != " ":
+                text = " " + text
+            search(
+                pos,
+                pending,
+                spaced,
+                space - len(text),
+                [*pieces, text],
+                text[-1] if text else last,
+            )
+
+        if width > space + tolerance:
+            if tok.type in (STRING, NAME, FSTRING_END) and (
+                tok.type != NAME or "." in tok.string
+            ):
+                splits = set()
+                for offset in SPLIT_OFFSETS:
+                    # Only split where the token actually overflows the run
+                    if not 0 < space + offset < width - tolerance:
+                        continue
+                    if len(variants) >= limit:
                         break
-                    if len(token_list[0].string.strip()) > space + tolerance:
-                        if token_list[0].type in (STRING, NAME, FSTRING_END):
-                            # We can't split NAMEs if they don't have a dot in them
-                            if (
-                                token_list[0].type == NAME
-                                and "." not in token_list[0].string
-                            ):
-                                break
-                            # If the string is too long, split it up
-                            left, right = partition_token(
-                                token_list.pop(0), space, tolerance
-                            )
-                            token_list.insert(0, right)
-                            cur_token = left
-                        else:
-                            # We can't resize, so continue to the next group :(
-                            break
-                    else:
-                        cur_token = token_list.pop(0)
-
-                    tok_str = cur_token.string.strip()
-
-                    match cur_token.type:
-                        case tk.NEWLINE:
-                            tok_str = tok_str + ";"
-                        case tk.NL:
-                            tok_str = ""
-                        case _:
-                            # Need to add a space between (NAMES, NUMBERS) and (keywords or NAMES)
-                            if (
-                                iskeyword(tok_str) or cur_token.type == NAME
-                            ) and old.type in (NAME, NUMBER):
-                                if new_tokens and (new_tokens[-1][-1] != " "):
-                                    tok_str = " " + tok_str
-                                if (
-                                    cur_line
-                                    and not new_tokens
-                                    and (cur_line[-1] != " ")
-                                ):
-                                    tok_str = " " + tok_str
-
-                    old = cur_token
-                    space -= len(tok_str)
-                    new_tokens.append(tok_str)
-                pos = 1
-                while space > 0:
-                    new_tokens.insert(pos, " ")
-                    space -= 1
-                    pos += 1
-                cur_line += "".join(new_tokens)
-                carry_over = space
-        if token_list:
-            cur_line = cur_line + "\\"
-        if cur_line:
-            new_lines += cur_line + "\n"
-
-    return "".join(new_lines)
+                    left, right = partition_token(tok, space + offset, tolerance)
+                    if left.string not in splits:
+                        splits.add(left.string)
+                        place(render_token(left), pos, right)
+        elif pending is not None:
+            place(render_token(pending), pos + 1, None)
+        else:
+            place(rendered[pos], pos + 1, None)
+        # Alternatively, leave this token for the next run
+        if width > space and len(variants) < limit:
+            finish(pieces, (pos, pending, prev_spaced), space)
+
+    search(*cursor, space, [], line_end)
+    return variants
+
+
+def layout_search(stream, outline_lines, tolerance, beam_width, limit, time_budget):
+    # Beam search over the ways of filling each run of the outline, minimizing the total number of
+    # cells that are padded or overshot. With beam_width=1 and limit=1 this is exactly the greedy
+    # layout of layout_lines. Returns the text for every outline line, the total deviation, and
+    # whether every token was placed.
+    outline_groups = [
+        generate_whitespace_groups(line.rstrip()) for line in outline_lines
+    ]
+    # Suffix sums of the outline cells and of the token widths, to steer the search away from
+    # layouts that no longer have room for the rest of the script
+    cells = [space for groups in outline_groups for ws, space in groups if not ws]
+    remaining_cells = list(accumulate(reversed(cells), initial=0))[::-1]
+    remaining_widths = list(accumulate(reversed(stream.widths), initial=0))[::-1]
+
+    def remaining_width(cursor):
+        pos, pending, _ = cursor
+        if pending is None:
+            return remaining_widths[pos]
+        return remaining_widths[pos + 1] + len(pending.string)
+
+    deadline = time.monotonic() + time_budget
+    # Each entry is (cost, cursor, history), where history is a linked list of (text, rest) with None
+    # marking line ends, so entries can share their common prefix.
+    beam = [(0, START, None)]
+    run = 0
+    for groups in outline_groups:
+        if time.monotonic() > deadline:
+            # Out of time, finish the remaining lines greedily from the best layout so far
+            beam, beam_width, limit = beam[:1], 1, 1
+        line_beam = [(cost, cursor, 0, "", history) for cost, cursor, history in beam]
+        for is_whitespace, space in groups:
+            if is_whitespace:
+                next_beam = []
+                for cost, cursor, carry_over, line_end, history in line_beam:
+                    text = " " * (space + carry_over)
+                    if text:
+                        line_end, history = text[-1], (text, history)
+                    next_beam.append((cost, cursor, carry_over, line_end, history))
+                line_beam = next_beam
+                continue
+            run += 1
+            best = {}
+            for cost, cursor, _, line_end, history in line_beam:
+                for text, new_cursor, carry_over, deviation in fill_group_variants(
+                    stream, cursor, space, tolerance, line_end, limit
+                ):
+                    new_end = text[-1] if text else line_end
+                    key = (new_cursor, carry_over, new_end)
+                    if key not in best or best[key][0] > cost + deviation:
+                        new_history = (text, history) if text else history
+                        best[key] = (
+                            cost + deviation,
+                            new_cursor,
+                            carry_over,
+                            new_end,
+                            new_history,
+                        )
+
+            def rank(entry):
+                overflow = remaining_width(entry[1]) - remaining_cells[run]
+                return entry[0] + OVERFLOW_PENALTY * max(overflow, 0), -entry[1][0]
+
+            line_beam = sorted(best.values(), key=rank)[:beam_width]
+        beam = {}
+        for cost, cursor, _, _, history in line_beam:
+            if not exhausted(stream, cursor):
+                history = ("\\", history)
+            if cursor not in beam or beam[cursor][0] > cost:
+                beam[cursor] = (cost, cursor, (None, history))
+        beam = sorted(beam.values(), key=lambda e: (remaining_width(e[1]), e[0]))
+
+    cost, cursor, history = beam[0]
+    pieces = []
+    while history is not None:
+        text, history = history
+        pieces.append(text)
+    lines, line = [], []
+    for text in reversed(pieces):
+        if text is None:
+            lines.append("".join(line))
+            line = []
+        else:
+            line.append(text)
+    return lines, cost, exhausted(stream, cursor)
+
+
+def optimal_layout_lines(
+    stream, outline_lines, tolerance=TOLERANCE, time_budget=LAYOUT_TIME_BUDGET
+):
+    outline_lines = list(outline_lines)
+    greedy = layout_search(stream, outline_lines, tolerance, 1, 1, float("inf"))
+    searched = layout_search(
+        stream, outline_lines, tolerance, BEAM_WIDTH, MAX_VARIANTS, time_budget
+    )
+    # The beam can prune the greedy layout, so never do worse than it
+    lines, _, _ = min(greedy, searched, key=lambda result: (not result[2], result[1]))
+    return lines
+
+
+def reflow_lines_optimal(
+    stream, outline_lines, tolerance=TOLERANCE, time_budget=LAYOUT_TIME_BUDGET
+):
+    yield from filter(
+        None, optimal_layout_lines(stream, outline_lines, tolerance, time_budget)
+    )
+
+
+def minify(script):
+    # python_minifier is only imported once something is actually reflowed
+    import python_minifier
+
+    return python_minifier.minify(script, **MINIFY_OPTIONS)
+
+
+@functools.cache
+def minifier_version():
+    from importlib import metadata
+
+    return metadata.version("python-minifier")
+
+
+def prepare_tokens(script, options=TranspileOptions()):
+    # Minify script, transpile it, and emit the tokens straight from the transpiled AST rather
+    # than unparsing it and tokenizing the result again
+    script = cached(
+        "minify", lambda: minify(script), script, MINIFY_OPTIONS, minifier_version()
+    )
+    return TokenStream(
+        cached(
+            "tokens", lambda: emit_tokens(transpile(script, options)), script, options
+        )
+    )
+
+
+@dataclass
+class ReflowCandidate:
+    tolerance: int
+    text: str
+    # Whether every token of the script made it into the outline
+    complete: bool
+    # Outline cells holding part of the script
+    filled: int
+    # Outline cells left blank
+    holes: int
+    # Characters outside of the outline, not counting line continuations
+    overflow: int
+    # "#" cells padding out the outline after the end of the script
+    padding: int
+    # Lines ending in a "\\" continuation
+    continuations: int
+
+    @property
+    def score(self):
+        # The number of cells where the result deviates from the outline, counting "#" padding
+        # as it holds none of the script, then the number of continuations. Lower is better.
+        if not self.complete:
+            return (math.inf, math.inf)
+        return (self.holes + self.overflow + self.padding, self.continuations)
+
+
+def layout_candidate(
+    stream, outline_lines, tolerance, layout="greedy", time_budget=LAYOUT_TIME_BUDGET
+):
+    if layout == "optimal":
+        lines = optimal_layout_lines(stream, outline_lines, tolerance, time_budget)
+    else:
+        lines = list(layout_lines(stream, outline_lines, tolerance))
+    filled = holes = overflow = continuations = 0
+    for outline_line, line in zip(outline_lines, lines):
+        if line.endswith("\\"):
+            continuations += 1
+            line = line[:-1]
+        for cell, char in zip_longest(outline_line.rstrip(), line, fillvalue=" "):
+            if not cell.isspace():
+                if char.isspace():
+                    holes += 1
+                else:
+                    filled += 1
+            elif not char.isspace():
+                overflow += 1
+    script_hashes = sum(text.count("#") for text, _, _ in stream.rendered)
+    padding = "".join(lines).count("#") - script_hashes
+    return ReflowCandidate(
+        tolerance=tolerance,
+        text="".join(["\n'';\\\n", *(line + "\n" for line in lines if line)]),
+        complete=not lines[-1].endswith("\\") if lines else not len(stream),
+        filled=filled - padding,
+        holes=holes,
+        overflow=overflow,
+        padding=padding,
+        continuations=continuations,
+    )
+
+
+def reflow_sweep(
+    script,
+    outline,
+    tolerances=SWEEP_TOLERANCES,
+    layout="greedy",
+    time_budget=LAYOUT_TIME_BUDGET,
+    jobs=None,
+    options=TranspileOptions(),
+):
+    # Lays the script out once per tolerance, preparing its tokens only once and spreading the
+    # layouts over a process pool, and returns every candidate with its fit.
+    stream = prepare_tokens(script, options)
+    outline_lines = outline.splitlines()
+    tolerances = list(tolerances)
+    if jobs == 1 or len(tolerances) <= 1:
+        return [
+            layout_candidate(stream, outline_lines, t, layout, time_budget)
+            for t in tolerances
+        ]
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(
+            pool.map(
+                layout_candidate,
+                repeat(stream),
+                repeat(outline_lines),
+                tolerances,
+                repeat(layout),
+                repeat(time_budget),
+            )
+        )
+
+
+def best_candidate(candidates):
+    # Ties go to the lowest tolerance
+    return min(candidates, key=lambda c: (c.score, c.tolerance))
+
+
+def best_reflow(script, outline, tolerances=SWEEP_TOLERANCES, **kwargs):
+    return best_candidate(reflow_sweep(script, outline, tolerances, **kwargs))
+
+
+def iter_reflow(
+    script,
+    outline_lines,
+    tolerance=TOLERANCE,
+    layout="greedy",
+    time_budget=LAYOUT_TIME_BUDGET,
+    options=TranspileOptions(),
+):
+    # Yields the reflowed script line by line (newlines included) as soon as each line is laid out.
+    # outline_lines can be any iterable of lines, such as an open file, and is consumed lazily
+    # by the greedy layout. The optimal layout needs to see the whole outline before it can start.
+    stream = prepare_tokens(script, options)
+    if layout == "optimal":
+        lines = reflow_lines_optimal(stream, outline_lines, tolerance, time_budget)
+    else:
+        lines = reflow_lines(stream, outline_lines, tolerance)
+    yield "\n"
+    yield "'';\\\n"
+    for line in lines:
+        yield line + "\n"
+
+
+def reflow(
+    script,
+    outline,
+    tolerance=TOLERANCE,
+    layout="greedy",
+    time_budget=LAYOUT_TIME_BUDGET,
+    options=TranspileOptions(),
+):
+    return "".join(
+        iter_reflow(
+            script, outline.splitlines(), tolerance, layout, time_budget, options
+        )
+    )
@@ -0,0 +1,17 @@
+import ast
+
+from . import injections
+from .injections import INJECTED_NAMES, Injected, injected_ast
+
+# The helpers that transpiled code otherwise defines for itself, defined once here for code
+# transpiled with shared_runtime, which imports them. They are compiled from the injections, so
+# tracebacks through them point into injections.py.
+__all__ = [name for names in INJECTED_NAMES.values() for name in names]
+
+exec(
+    compile(
+        ast.Module(body=[injected_ast(inject) for inject in Injected], type_ignores=[]),
+        injections.__file__,
+        "exec",
+    )
+)
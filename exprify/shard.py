@@ -0,0 +1,122 @@
+import ast
+import os
+import re
+from dataclasses import dataclass
+
+from .ast_transformer import StatementMapper, TranspileOptions
+from .emitter import emit_source
+from .incremental import injections_source, split_chunks, uses_variables
+
+# Every worker gets several shards, so that one slow shard doesn't hold up the others
+SHARDS_PER_JOB = 4
+# Shards name their intermediates with this prefix, and are renumbered once it's known how many
+# intermediates the shards before them used
+SHARD_PREFIX = "exprify_shard_"
+
+
+class ShardMapper(StatementMapper):
+    def intermediate_name_gen(self):
+        return f"{SHARD_PREFIX}{next(self.intermediate_names)}"
+
+
+@dataclass
+class Shard:
+    script: str
+    # How many intermediate names the shard used
+    names: int
+    # The variables assigned at the top level by the end of the shard, in order
+    variables: tuple
+    required_injects: frozenset
+    # Whether the shard has a try at the top level, whose lowering depends on the variables
+    # assigned before it
+    uses_variables: bool
+
+
+def split_shards(source, count):
+    # Splits the source into about count shards of whole lines, each of them whole top level
+    # statements, returning the line each one starts on along with its source
+    chunks = list(split_chunks(source.splitlines(keepends=True)))
+    size = max(1, len(source) // count)
+    shards, shard, shard_size, line = [], [], 0, 1
+    for chunk in chunks:
+        shard.append(chunk)
+        shard_size += len(chunk)
+        if shard_size >= size:
+            shards.append((line, "".join(shard)))
+            line += sum(c.count("\n") for c in shard)
+            shard, shard_size = [], 0
+    if shard:
+        shards.append((line, "".join(shard)))
+    return shards
+
+
+def lower_shard(line, source, variables=(), options=TranspileOptions()):
+    # Blank lines in front give the statements the locations they have in the whole script
+    body = ast.parse("\n" * (line - 1) + source).body
+    mapper = ShardMapper(options)
+    mapper.scopes.current_scope().extend_vars(
+        ast.Name(id=name, ctx=ast.Store()) for name in variables
+    )
+    module = mapper.generic_visit(ast.Module(body=body, type_ignores=[]))
+    module.body = [
+        node if isinstance(node, ast.stmt) else ast.Expr(value=node)
+        for node in module.body
+    ]
+    return Shard(
+        emit_source(ast.fix_missing_locations(module)),
+        next(mapper.intermediate_names) - 1,
+        tuple(mapper.scopes.current_scope().variables),
+        frozenset(mapper.required_injects),
+        any(uses_variables(stmt) for stmt in body),
+    )
+
+
+def renumber(script, offset):
+    return re.sub(
+        rf"{SHARD_PREFIX}(\d+)", lambda m: f"inter{int(m[1]) + offset}", script
+    )
+
+
+def transpile_sharded(source, options=TranspileOptions(), jobs=None):
+    # Transpiles the top level statements of a script in parallel, with the same result as
+    # transpiling it serially
+    from .transpile import transpile
+
+    jobs = jobs or os.cpu_count() or 1
+    shards = split_shards(source, jobs * SHARDS_PER_JOB)
+    if jobs == 1 or len(shards) <= 1 or SHARD_PREFIX in source:
+        return emit_source(transpile(source, options))
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        try:
+            lowered = list(
+                pool.map(
+                    lower_shard,
+                    *zip(*shards),
+                    [()] * len(shards),
+                    [options] * len(shards),
+                )
+            )
+        except SyntaxError:
+            # Either the script doesn't parse, or the shards were split in the middle of a
+            # statement, in which case the serial transpile is the one to trust
+            return emit_source(transpile(source, options))
+        # A try at the top level copies the variables assigned before it, which a shard only
+        # knows once the shards before it are lowered
+        variables, again = {}, {}
+        for i, shard in enumerate(lowered):
+            if shard.uses_variables and variables:
+                again[i] = pool.submit(
+                    lower_shard, *shards[i], tuple(variables), options
+                )
+            variables.update(dict.fromkeys(shard.variables))
+        for i, future in again.items():
+            lowered[i] = future.result()
+    injects = set().union(*(shard.required_injects for shard in lowered))
+    scripts = [injections_source(frozenset(injects), options)]
+    offset = 0
+    for shard in lowered:
+        scripts.append(renumber(shard.script, offset))
+        offset += shard.names
+    return "\n".join(script for script in scripts if script)
@@ -1,24 +1,49 @@
 import ast
-import inspect
+import functools
 
-from .ast_transformer import StatementMapper
-from .injections import injected_ast_objs
+from .ast_transformer import ExprifyException, StatementMapper, TranspileOptions
+from .cache import cache_enabled, cached, code_path, load_code, store_code
+from .emitter import emit_source
+from .injections import INJECTED_NAMES, RUNTIME_MODULE, Injected, injected_ast
 
+EXPRIFIED_CACHE_SIZE = 256
 
-def transpile(source):
-    mapper = StatementMapper()
+
+def injections(required_injects, options=TranspileOptions()):
+    # In a fixed order, rather than the set's, so identical sources transpile identically
+    injects = [inject for inject in Injected if inject in required_injects]
+    if not options.shared_runtime:
+        return [injected_ast(inject) for inject in injects]
+    if not injects:
+        return []
+    imports = ast.ImportFrom(
+        module=RUNTIME_MODULE,
+        names=[
+            ast.alias(name=name)
+            for inject in injects
+            for name in INJECTED_NAMES[inject]
+        ],
+        level=0,
+    )
+    return [ast.Expr(value=StatementMapper(options).visit(imports))]
+
+
+def transpile(source, options=TranspileOptions()):
+    mapper = StatementMapper(options)
     a = mapper.generic_visit(ast.parse(source))
-    a.body = [ast.Expr(value=node) for node in a.body]
-    if mapper.required_injects:
-        for inject in mapper.required_injects:
-            a.body.insert(0, injected_ast_objs[inject])
+    a.body = [
+        node if isinstance(node, ast.stmt) else ast.Expr(value=node) for node in a.body
+    ]
+    a.body[:0] = injections(mapper.required_injects, options)
     a = ast.fix_missing_locations(a)
     return a
 
 
-def transpiled_function_ast(func, debug=False):
-    a = transpile(inspect.getsource(func))
-    src = ast.unparse(a)
+def transpiled_function_ast(func, debug=False, options=TranspileOptions()):
+    import inspect
+
+    a = transpile(inspect.getsource(func), options)
+    src = emit_source(a)
     if debug:
         ref = ast.dump(ast.parse(inspect.getsource(func)), indent=1)
         gen = ast.dump(a, indent=1)
@@ -28,21 +53,116 @@ def transpiled_function_ast(func, debug=False):
     return src
 
 
-def transpiled_script(filename):
+def transpiled_script(filename, options=TranspileOptions()):
     with open(filename, "r") as f:
         src = f.read()
-    return transpile_script_source(src)
+    return transpile_script_source(src, options)
+
+
+def function_source(func):
+    # The function's source, dedented and preceded by blank lines so that the transpiled AST has
+    # the line numbers of the file it came from
+    import inspect
+    import textwrap
 
+    lines, first_line = inspect.getsourcelines(func)
+    return "\n" * max(first_line - 1, 0) + textwrap.dedent("".join(lines))
 
-def transpiled_function_object(func, debug=False):
-    a = transpiled_function_ast(func, debug)
+
+def transpiled_code(source, filename="<exprify>", options=TranspileOptions()):
+    # Compiles the transpiled AST straight to a code object, without emitting and parsing it again
+    return compile(transpile(source, options), filename, "exec")
+
+
+def transpiled_function_object(func, debug=False, options=TranspileOptions()):
+    import inspect
+
+    if debug:
+        transpiled_function_ast(func, debug, options)
     namespace = {}
-    compiled_ast = compile(a, filename="", mode="exec")
-    exec(compiled_ast, namespace)
+    code = transpiled_code(
+        function_source(func), inspect.getsourcefile(func) or "<exprify>", options
+    )
+    exec(code, namespace)
     return namespace[func.__name__]
 
 
-def transpile_script_source(src):
-    a = transpile(src)
-    unparsed = ast.unparse(a)
-    return unparsed
+def transpile_script_source(src, options=TranspileOptions(), jobs=1):
+    # With more than one job, the script's top level statements are lowered in parallel, which
+    # transpiles to the same result
+    def compute():
+        if jobs == 1:
+            return emit_source(transpile(src, options))
+        from .shard import transpile_sharded
+
+        return transpile_sharded(src, options, jobs)
+
+    return cached("transpile", compute, src, options)
+
+
+def exprified_tree(code, options=TranspileOptions()):
+    # The function and its injections are bound inside a lambda, which returns the function. It
+    # is evaluated in the function's own module, so the function sees the module's globals as
+    # they change, while the injected names stay out of them.
+    tree = transpile(function_source(code), options)
+    values = []
+    for node in tree.body:
+        value = node.value if isinstance(node, ast.Expr) else node
+        if isinstance(value, ast.Assign):
+            value = ast.NamedExpr(target=value.targets[0], value=value.value)
+        values.append(value)
+    factory = ast.Lambda(
+        args=ast.arguments(
+            posonlyargs=[], args=[], kwonlyargs=[], kw_defaults=[], defaults=[]
+        ),
+        body=ast.Subscript(
+            value=ast.List(elts=values, ctx=ast.Load()),
+            slice=ast.UnaryOp(op=ast.USub(), operand=ast.Constant(value=1)),
+            ctx=ast.Load(),
+        ),
+    )
+    return ast.fix_missing_locations(ast.Expression(body=factory))
+
+
+@functools.lru_cache(maxsize=EXPRIFIED_CACHE_SIZE)
+def exprified_code(code, filename, options=TranspileOptions(), persist=False):
+    # Compiled once per distinct code object and file, as code objects compare equal to the same
+    # code from another file. With persist, the result is also kept on disk so later processes
+    # only need to load it.
+    import marshal
+
+    persist = persist and cache_enabled()
+    if persist:
+        # Version 2 of the format has no references between objects, which depend on refcounts
+        path = code_path(filename, code.co_qualname, marshal.dumps(code, 2), options)
+        if (compiled := load_code(path)) is not None:
+            return compiled
+    compiled = compile(exprified_tree(code, options), filename, "eval")
+    if persist:
+        store_code(path, compiled)
+    return compiled
+
+
+def exprified(func=None, *, options=TranspileOptions(), persist=False):
+    # Decorator that replaces func with its transpiled version, transpiled on the first call
+    if func is None:
+        return functools.partial(exprified, options=options, persist=persist)
+    if func.__code__.co_freevars:
+        raise ExprifyException(
+            "Exprify can't transpile functions that use variables of an enclosing function"
+        )
+    transpiled = None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        nonlocal transpiled
+        if transpiled is None:
+            transpiled = eval(
+                exprified_code(
+                    func.__code__, func.__code__.co_filename, options, persist
+                ),
+                func.__globals__,
+            )()
+        return transpiled(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,11 @@
+import pytest
+
+from exprify import cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path_factory, monkeypatch):
+    # Tests never read or fill the user's own cache
+    monkeypatch.setenv(
+        cache.CACHE_DIR_ENV, str(tmp_path_factory.mktemp("exprify-cache"))
+    )
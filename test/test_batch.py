@@ -0,0 +1,61 @@
+import shutil
+
+from exprify.batch import transpile_tree
+from .utils import exec_with_output
+
+
+def test_transpile_tree(tmp_path):
+    src = tmp_path / "src"
+    (src / "pkg").mkdir(parents=True)
+    shutil.copy("test_scripts/zipy.py", src / "zipy.py")
+    shutil.copy("test_scripts/rijndael.py", src / "pkg" / "rijndael.py")
+    (src / "pkg" / "broken.py").write_text("def f(:\n")
+    out = tmp_path / "out"
+
+    results = transpile_tree([src], out, jobs=2)
+    status = {r.source.name: r.ok for r in results}
+    assert status == {"zipy.py": True, "rijndael.py": True, "broken.py": False}
+    for name in ("zipy.py", "pkg/rijndael.py"):
+        assert exec_with_output((out / name).read_text()) == exec_with_output(
+            (src / name).read_text()
+        )
+    assert not (out / "pkg" / "broken.py").exists()
+
+
+def test_transpile_tree_collision(tmp_path):
+    # Two inputs with the same name would be written to the same output
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "x.py").write_text(f"print({name!r})\n")
+    (tmp_path / "a" / "y.py").write_text("print('y')\n")
+    out = tmp_path / "out"
+
+    results = transpile_tree(
+        [tmp_path / "a" / "x.py", tmp_path / "b" / "x.py", tmp_path / "a" / "y.py"],
+        out,
+        jobs=1,
+    )
+    assert [r.ok for r in results] == [False, False, True]
+    assert not (out / "x.py").exists()
+    assert exec_with_output((out / "y.py").read_text()) == "y\n"
+
+
+def test_batch_layout(tmp_path, monkeypatch):
+    # The layout given on the command line is used for every file
+    from exprify import reflow
+    from exprify.__main__ import main
+
+    src = tmp_path / "src"
+    src.mkdir()
+    shutil.copy("test_scripts/zipy.py", src / "zipy.py")
+    outline = "reflow_outlines/outline1.txt"
+    outputs = {}
+    for layout in ("greedy", "optimal"):
+        out = tmp_path / layout
+        argv = ["exprify", str(src), "-d", str(out), "-o", outline, "-t", "4"]
+        monkeypatch.setattr("sys.argv", argv + ["--layout", layout])
+        main()
+        outputs[layout] = (out / "zipy.py").read_text()
+    assert outputs["greedy"] != outputs["optimal"]
+    script, outline = open("test_scripts/zipy.py").read(), open(outline).read()
+    assert outputs["optimal"] == reflow(script, outline, 4, layout="optimal") + "\n"
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from exprify import cache, transpile_script_source
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv(cache.CACHE_DISABLE_ENV, raising=False)
+    monkeypatch.setenv(cache.CACHE_DIR_ENV, str(tmp_path))
+    return tmp_path
+
+
+def test_cached_hit(cache_dir):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return ["result"]
+
+    assert cache.cached("stage", compute, "source") == ["result"]
+    assert cache.cached("stage", compute, "source") == ["result"]
+    assert len(calls) == 1
+    assert cache.cached("stage", compute, "other source") == ["result"]
+    assert cache.cached("other stage", compute, "source") == ["result"]
+    assert len(calls) == 3
+
+
+def test_cached_disabled(cache_dir, monkeypatch):
+    monkeypatch.setenv(cache.CACHE_DISABLE_ENV, "1")
+    calls = []
+    cache.cached("stage", lambda: calls.append(1), "source")
+    cache.cached("stage", lambda: calls.append(1), "source")
+    assert len(calls) == 2
+    assert not os.listdir(cache_dir)
+
+
+@pytest.mark.parametrize(
+    "content",
+    [b"\x80\x05\x95", b"cos\nnonexist\n.", b"cnomod_xyz\nf\n.", b"not a pickle"],
+    ids=["truncated", "missing_attribute", "missing_module", "garbage"],
+)
+def test_cached_bad_entry(cache_dir, content):
+    # A bad entry is computed again and replaced
+    assert transpile_script_source("print(1)") == "print(1)"
+    (entry,) = cache_dir.iterdir()
+    entry.write_bytes(content)
+    assert transpile_script_source("print(1)") == "print(1)"
+    assert transpile_script_source("print(1)") == "print(1)"
+    assert entry.read_bytes() != content
+
+
+def test_cache_eviction(cache_dir, monkeypatch):
+    monkeypatch.setenv(cache.CACHE_SIZE_ENV, "2000")
+    for i in range(10):
+        cache.cached("stage", lambda: "x" * 500, str(i))
+    sizes = [entry.stat().st_size for entry in os.scandir(cache_dir)]
+    assert 0 < sum(sizes) <= 2000
+
+
+def test_transpile_cached(cache_dir):
+    src = open("test_scripts/zipy.py").read()
+    assert transpile_script_source(src) == transpile_script_source(src)
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_cache_eviction_scans_rarely(cache_dir, monkeypatch):
+    # Writes that keep the cache within its size don't scan the directory
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda *args: scans.append(1) or evict(*args))
+    for i in range(20):
+        cache.cached("stage", lambda: "x", str(i))
+    assert len(scans) == 1
+
+
+def test_code_eviction(tmp_path, monkeypatch):
+    # Compiled functions kept next to their sources are bounded by the cache size, and the
+    # interpreter's own bytecode beside them is left alone
+    monkeypatch.setenv(cache.CACHE_SIZE_ENV, "2000")
+    (tmp_path / "__pycache__").mkdir()
+    own = tmp_path / "__pycache__" / "module.cpython-311.pyc"
+    own.write_bytes(b"x" * 5000)
+    code = compile("x = '" + "x" * 400 + "'", "module.py", "exec")
+    for i in range(10):
+        cache.store_code(cache.code_path(tmp_path / "module.py", "f", i), code)
+    entries = list((tmp_path / "__pycache__").glob("*" + cache.CODE_SUFFIX))
+    assert 0 < sum(entry.stat().st_size for entry in entries) <= 2000
+    assert own.exists()
@@ -0,0 +1,76 @@
+import importlib
+import sys
+
+import pytest
+
+from exprify import install_import_hook, uninstall_import_hook
+from exprify import import_hook
+from exprify.import_hook import ExprifyLoader
+
+PACKAGE_INIT = """
+from .search import search
+"""
+
+PACKAGE_SEARCH = """
+def search(items, target):
+    found = -1
+    for i, item in enumerate(items):
+        if item == target:
+            found = i
+            break
+    return found
+"""
+
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    pkg = tmp_path / "hooked_pkg"
+    pkg.mkdir()
+    (pkg / "__init__.py").write_text(PACKAGE_INIT)
+    (pkg / "search.py").write_text(PACKAGE_SEARCH)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+    finder = install_import_hook("hooked_pkg")
+    yield pkg
+    uninstall_import_hook(finder)
+    for name in ("hooked_pkg", "hooked_pkg.search"):
+        sys.modules.pop(name, None)
+
+
+def reimport(name):
+    for module in [m for m in sys.modules if m.split(".")[0] == name.split(".")[0]]:
+        del sys.modules[module]
+    importlib.invalidate_caches()
+    return importlib.import_module(name)
+
+
+def test_import_hook(package):
+    pkg = importlib.import_module("hooked_pkg")
+    assert pkg.search([3, 1, 2], 1) == 1
+    assert isinstance(pkg.__loader__, ExprifyLoader)
+    assert isinstance(sys.modules["hooked_pkg.search"].__loader__, ExprifyLoader)
+    # The module ran transpiled, where the function is a lambda
+    assert pkg.search.__name__ == "<lambda>"
+    cached = list((package / "__pycache__").glob("*.opt-exprify*.pyc"))
+    assert len(cached) == 2
+
+
+def test_import_hook_cached(package, monkeypatch):
+    importlib.import_module("hooked_pkg")
+    # A warm import loads the cached code without transpiling again
+    monkeypatch.setattr(import_hook, "transpile", None)
+    assert reimport("hooked_pkg").search([1, 2], 2) == 1
+
+
+def test_import_hook_invalidated(package):
+    importlib.import_module("hooked_pkg")
+    # Changing the source, which changes its size, transpiles it again
+    (package / "search.py").write_text(PACKAGE_SEARCH + "\nsearch = len\n")
+    assert reimport("hooked_pkg").search([1, 2]) == 2
+
+
+def test_import_hook_opt_in(package, tmp_path):
+    (tmp_path / "plain_module.py").write_text("x = 1\n")
+    module = importlib.import_module("plain_module")
+    assert not isinstance(module.__loader__, ExprifyLoader)
+    sys.modules.pop("plain_module")
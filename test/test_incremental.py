@@ -0,0 +1,119 @@
+import os
+import threading
+
+import pytest
+
+from exprify.incremental import IncrementalTranspiler, iter_watch
+from .utils import exec_with_output
+
+SCRIPT = """
+def double(x):
+    return x * 2
+
+
+def halve(x):
+    return x / 2
+
+
+print(double(3), halve(3))
+"""
+
+TRY_SCRIPT = """
+n = 3
+try:
+    n // 0
+except ZeroDivisionError:
+    n + 1
+print(n)
+"""
+
+
+@pytest.mark.parametrize("name", ["zipy.py", "rijndael.py"])
+def test_incremental_scripts(name):
+    script = open(f"test_scripts/{name}").read()
+    transpiler = IncrementalTranspiler()
+    assert exec_with_output(transpiler.transpile(script)) == exec_with_output(script)
+    # Nothing changed, so nothing is lowered again
+    assert exec_with_output(transpiler.transpile(script)) == exec_with_output(script)
+    assert transpiler.last_lowered == 0
+
+
+def test_incremental_edit():
+    transpiler = IncrementalTranspiler()
+    transpiler.transpile(SCRIPT)
+    assert transpiler.last_lowered == 3
+    edited = SCRIPT.replace("x * 2", "x * 4")
+    assert exec_with_output(transpiler.transpile(edited)) == exec_with_output(edited)
+    assert transpiler.last_lowered == 1
+
+
+def test_incremental_injections():
+    transpiler = IncrementalTranspiler()
+    assert "iEH" in transpiler.transpile(SCRIPT + TRY_SCRIPT)
+    # The injection goes away along with the last statement that needed it
+    assert "iEH" not in transpiler.transpile(SCRIPT)
+    assert transpiler.last_lowered == 0
+
+
+def test_incremental_try_variables():
+    transpiler = IncrementalTranspiler()
+    assert exec_with_output(transpiler.transpile(TRY_SCRIPT)) == "3\n"
+    # The try copies the variables assigned before it, so it is lowered again when they change
+    edited = "m = 4\n" + TRY_SCRIPT
+    assert exec_with_output(transpiler.transpile(edited)) == "3\n"
+    assert transpiler.last_lowered == 2
+    assert exec_with_output(transpiler.transpile(edited)) == "3\n"
+    assert transpiler.last_lowered == 0
+
+
+def test_incremental_earlier_assignment_removed():
+    # A statement lowered while an earlier one assigned the same name still reports that it
+    # assigns it once the earlier one is gone, for the try that copies it
+    script = (
+        "x = 5\nx = 6\ntry:\n    x += 1\nexcept TypeError:\n    print('no')\nprint(x)\n"
+    )
+    edited = script.replace("x = 5\n", "")
+    transpiler = IncrementalTranspiler()
+    assert exec_with_output(transpiler.transpile(script)) == "7\n"
+    assert exec_with_output(transpiler.transpile(edited)) == "7\n"
+
+
+def test_iter_watch(tmp_path):
+    path = tmp_path / "script.py"
+    path.write_text(SCRIPT)
+    watch = iter_watch(path, interval=0.01)
+    first = next(watch)
+    assert first.ok and first.lowered == 3
+    path.write_text("def f(:\n")
+    os.utime(path, ns=(0, 1))
+    assert not next(watch).ok
+    path.write_text(SCRIPT.replace("x / 2", "x / 4"))
+    os.utime(path, ns=(0, 2))
+    result = next(watch)
+    assert result.ok and result.lowered == 1
+    assert exec_with_output(result.script) == "6 0.75\n"
+
+
+def test_incremental_chunks():
+    # The string spans lines that start at the first column, and some statements repeat
+    script = 'text = """\nprint(1)\n"""\nprint(text)\nprint(text)\n'
+    transpiler = IncrementalTranspiler()
+    assert exec_with_output(transpiler.transpile(script)) == exec_with_output(script)
+    edited = script + "if text:\n    print(2)\nelse:\n    print(3)\n"
+    assert exec_with_output(transpiler.transpile(edited)) == exec_with_output(edited)
+    assert transpiler.last_lowered == 1
+
+
+def test_iter_watch_replaced(tmp_path):
+    # Saving by renaming a new file over the old one leaves no file for a moment
+    path = tmp_path / "script.py"
+    path.write_text(SCRIPT)
+    watch = iter_watch(path, interval=0.01)
+    assert next(watch).ok
+    replacement = tmp_path / "script.py.new"
+    replacement.write_text(SCRIPT.replace("x / 2", "x / 4"))
+    os.utime(replacement, ns=(0, 1))
+    path.unlink()
+    threading.Timer(0.05, os.replace, (replacement, path)).start()
+    result = next(watch)
+    assert result.ok and exec_with_output(result.script) == "6 0.75\n"
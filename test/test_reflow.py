@@ -1,8 +1,21 @@
+import ast
 import pytest
 from .utils import exec_with_output
 
-from tokenize import TokenInfo, STRING
-from exprify import reflow, partition_token
+from tokenize import TokenInfo, STRING, NL
+from exprify import reflow, iter_reflow, reflow_sweep, best_reflow, partition_token
+from exprify.reflow import (
+    prepare_tokens,
+    layout_lines,
+    layout_search,
+    poss_fstring_splits,
+    BEAM_WIDTH,
+    MAX_VARIANTS,
+    ReflowCandidate,
+    best_candidate,
+)
+from exprify.emitter import emit_tokens
+from exprify.transpile import transpile
 
 OUTLINES_PATH = "reflow_outlines"
 SCRIPTS_PATH = "test_scripts"
@@ -108,3 +121,130 @@ def test_partition_escape():
     token = TokenInfo(string="f'\x05\x04'", type=STRING, start=0, end=0, line=0)
     assert partition_token(token, 3, 0)[0].string == "f'\x05'"
     assert partition_token(token, 4, 0)[0].string == "f'\x05\x04'"
+
+
+def test_iter_reflow_lazy():
+    script = open("test_scripts/zipy.py").read()
+    outline = open("reflow_outlines/outline1.txt").read()
+    consumed = []
+
+    def outline_lines():
+        for line in outline.splitlines():
+            consumed.append(line)
+            yield line
+
+    lines = iter_reflow(script, outline_lines(), tolerance=4)
+    first = [next(lines) for _ in range(3)]
+    assert len(consumed) == 1
+    assert "".join(first + list(lines)) == reflow(script, outline, tolerance=4)
+
+
+@pytest.mark.parametrize(
+    ("script", "outline", "tolerance"),
+    [
+        *[
+            ("test_scripts/zipy.py", "reflow_outlines/outline1.txt", tol)
+            for tol in (0, 4, 8)
+        ],
+        *[
+            ("test_scripts/rijndael.py", "reflow_outlines/outline2.txt", tol)
+            for tol in (0, 4, 8)
+        ],
+    ],
+)
+def test_reflow_optimal(script, outline, tolerance):
+    outline = open(outline).read()
+    script = open(script).read()
+    reflowed_script = reflow(script, outline, tolerance=tolerance, layout="optimal")
+    print(reflowed_script)
+    assert exec_with_output(reflowed_script) == exec_with_output(script)
+
+    stream = prepare_tokens(script)
+    lines = outline.splitlines()
+    greedy, greedy_cost, _ = layout_search(stream, lines, tolerance, 1, 1, 10)
+    _, cost, complete = layout_search(
+        stream, lines, tolerance, BEAM_WIDTH, MAX_VARIANTS, 10
+    )
+    assert greedy == list(layout_lines(stream, lines, tolerance))
+    assert complete and cost <= greedy_cost
+
+
+def test_reflow_sweep():
+    outline = open("reflow_outlines/outline1.txt").read()
+    script = open("test_scripts/zipy.py").read()
+    candidates = reflow_sweep(script, outline, range(0, 10), jobs=2)
+    assert [c.tolerance for c in candidates] == list(range(0, 10))
+    for c in candidates:
+        assert c.complete
+        assert c.text == reflow(script, outline, tolerance=c.tolerance)
+    best = best_reflow(script, outline, jobs=1)
+    assert best.score == min(c.score for c in candidates)
+    assert exec_with_output(best.text) == exec_with_output(script)
+
+
+def test_best_candidate():
+    def candidate(tolerance, holes=0, padding=0, continuations=0, complete=True):
+        return ReflowCandidate(
+            tolerance, "", complete, 0, holes, 0, padding, continuations
+        )
+
+    # Padding the outline with "#" deviates from it like leaving it blank does
+    padded = candidate(0, padding=5)
+    assert best_candidate([padded, candidate(1, holes=2)]).tolerance == 1
+    assert best_candidate([padded, candidate(1, holes=6)]).tolerance == 0
+    # Then fewer continuations win, and only then the lower tolerance
+    assert (
+        best_candidate(
+            [candidate(0, continuations=3), candidate(1, continuations=2)]
+        ).tolerance
+        == 1
+    )
+    assert best_candidate([candidate(1), candidate(0)]).tolerance == 0
+    assert (
+        best_candidate([candidate(0, complete=False), candidate(1, holes=50)]).tolerance
+        == 1
+    )
+
+
+def test_fstring_split_index():
+    ts = "f'ab{x}cd\\n{y:>{w}}ef'"
+    assert poss_fstring_splits(ts, 4, 2) == [(2, 2)]
+    assert poss_fstring_splits(ts, 8, 3) == []
+    assert poss_fstring_splits(ts, 12, 4) == []
+    assert poss_fstring_splits(ts, 17, 3) == [(19, 2), (20, 3)]
+    token = TokenInfo(string=ts, type=STRING, start=0, end=0, line=0)
+    assert [t.string for t in partition_token(token, 17, 3)] == [
+        "f'ab{x}cd\\n{y:>{w}}'",
+        "f'ef'",
+    ]
+
+
+@pytest.mark.parametrize("script", ["test_scripts/zipy.py", "test_scripts/rijndael.py"])
+def test_emit_tokens(script):
+    # The emitted tokens must spell out the same program as unparsing the transpiled AST
+    tree = transpile(open(script).read())
+    tokens = emit_tokens(tree)
+    assert all(tok.type != NL for tok in tokens)
+    emitted = ast.parse(" ".join(tok.string for tok in tokens).replace("\n ", "\n"))
+    assert ast.dump(emitted) == ast.dump(ast.parse(ast.unparse(tree)))
+
+
+def test_reflow_keyword_spacing():
+    script = "def f(a):\n    x = a if a else 0\n    return x in b''\nprint(f(1))\n"
+    reflowed_script = reflow(script, "#" * 40 + "\n" + "#" * 40, tolerance=0)
+    assert exec_with_output(reflowed_script) == exec_with_output(script)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_cli_tolerance_zero(stream, monkeypatch, capsys):
+    # An explicit tolerance of 0 isn't replaced by the default
+    from exprify.__main__ import main
+
+    script = f"{SCRIPTS_PATH}/zipy.py"
+    outline = f"{OUTLINES_PATH}/outline1.txt"
+    argv = ["exprify", script, "-o", outline, "-t", "0"]
+    monkeypatch.setattr("sys.argv", argv + (["--stream"] if stream else []))
+    main()
+    expected = reflow(open(script).read(), open(outline).read(), tolerance=0)
+    assert capsys.readouterr().out.rstrip("\n") == expected.rstrip("\n")
+    assert expected != reflow(open(script).read(), open(outline).read())
@@ -0,0 +1,52 @@
+import pytest
+
+from exprify.shard import split_shards, transpile_sharded
+from exprify.transpile import transpile_script_source
+from .utils import exec_with_output
+
+FUNCTION = """
+def double{i}(x):
+    total = 0
+    for _ in range(2):
+        total += x
+    return total
+"""
+
+TRY_SCRIPT = """
+n = 3
+try:
+    n // 0
+except ZeroDivisionError:
+    n + 1
+print(n, double0(n))
+"""
+
+
+def serial(script):
+    return transpile_script_source(script, jobs=1)
+
+
+@pytest.mark.parametrize("name", ["zipy.py", "rijndael.py"])
+def test_transpile_sharded_scripts(name):
+    script = open(f"test_scripts/{name}").read()
+    assert transpile_sharded(script, jobs=2) == serial(script)
+
+
+def test_transpile_sharded_variables():
+    # The try is in the last shard, and still copies the variables assigned in the others
+    script = "".join(FUNCTION.format(i=i) for i in range(20)) + TRY_SCRIPT
+    assert len(split_shards(script, 8)) > 1
+    result = transpile_sharded(script, jobs=2)
+    assert result == serial(script)
+    assert exec_with_output(result) == "3 6\n"
+
+
+def test_transpile_sharded_split_statement():
+    # The string spans a line at the first column, so the shards are split inside it
+    script = 'text = """\nprint(1)\n"""\n' * 8 + "print(text)\n"
+    assert transpile_sharded(script, jobs=2) == serial(script)
+
+
+def test_transpile_sharded_syntax_error():
+    with pytest.raises(SyntaxError):
+        transpile_sharded("x = 1\n" * 8 + "def f(:\n", jobs=2)
@@ -1,6 +1,12 @@
+import asyncio
+import importlib.util
+import tracemalloc
+from itertools import islice
+
 import pytest
 
-from exprify import transpiled_function_object
+from exprify import cache, exprified, transpiled_function_object, TranspileOptions
+from exprify import transpile as transpile_module
 from exprify.ast_transformer import ExprifyException
 
 
@@ -141,6 +147,34 @@ def raise_from_func():
     raise ValueError("first one") from IndexError("second one")
 
 
+def raise_class_from_func():
+    raise ValueError from IndexError
+
+
+def raise_from_none_func():
+    try:
+        {}["missing"]
+    except KeyError:
+        raise ValueError("missing") from None
+
+
+def raise_custom_func():
+    # Can't be rebuilt from its args
+    class CodeError(Exception):
+        def __init__(self, *, code):
+            Exception.__init__(self, f"failed with {code}")
+            self.code = code
+
+    raise CodeError(code=3)
+
+
+def reraise_func():
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        raise
+
+
 def try_func():
     a = 1
     b = 2
@@ -240,6 +274,214 @@ def try_exception_order_func():
         return "blah"
 
 
+def continue_func():
+    total = 0
+    for i in range(10):
+        if i % 2 == 0:
+            continue
+        total += i
+    return total
+
+
+def break_func():
+    found = None
+    for i, x in enumerate([5, 6, 7, 6]):
+        if x == 6:
+            found = i
+            break
+        found = -1
+    else:
+        found = "not found"
+    return found
+
+
+def for_else_func():
+    out = []
+    for i in range(3):
+        out.append(i)
+    else:
+        out.append("done")
+    for i in range(3):
+        if i > 5:
+            break
+    else:
+        out.append("not broken")
+    return out
+
+
+def while_break_func():
+    n = 0
+    seen = []
+    while True:
+        n += 1
+        if n % 3 == 0:
+            continue
+        if n > 10:
+            break
+        seen.append(n)
+    return seen
+
+
+def nested_break_func():
+    out = []
+    for i in range(4):
+        for j in range(4):
+            if j > i:
+                break
+            if j == 1:
+                continue
+            out.append((i, j))
+        else:
+            out.append("inner done")
+        if i == 2:
+            continue
+        out.append(i)
+    return out
+
+
+def break_keeps_iterator_func():
+    # Nothing past the item that broke the loop is taken from the iterator
+    it = iter(range(10))
+    for x in it:
+        if x == 3:
+            break
+    return list(it)
+
+
+def try_break_func():
+    r = []
+    for i in range(5):
+        x = i
+        try:
+            r.append(x)
+            1 / 0
+        except ZeroDivisionError:
+            if x == 2:
+                break
+    return r
+
+
+def try_no_exception_func():
+    a = 1
+    b = 2
+    try:
+        a = a + b
+    except TypeError:
+        a = 0
+    finally:
+        b = 0
+    return a, b
+
+
+def try_dispatch_func():
+    # Raises the same exception types over and over, which are handled by the first matching
+    # except clause even where a later one matches them exactly
+    values = [1, "x", 2, None, 3]
+    lookup = {1: 1}
+    kinds = []
+    i = 0
+    while i < 10:
+        value = values[i % 5]
+        try:
+            lookup[value] + 1
+            kinds.append("ok")
+        except LookupError:
+            kinds.append("lookup")
+        except KeyError:
+            kinds.append("key")
+        except TypeError:
+            kinds.append("type")
+        i += 1
+    return kinds
+
+
+def try_loop_target_func():
+    r = []
+    for i in range(6):
+        try:
+            if i % 2 == 0:
+                r.append(1)
+            else:
+                1 / 0
+        except ZeroDivisionError:
+            r.append(0)
+    return r
+
+
+def try_changing_type_func():
+    # The type caught by the first clause changes on every iteration
+    errors = [KeyError, IndexError]
+    caught = []
+    j = 0
+    while j < 2:
+        error = errors[j]
+        try:
+            {}[0]
+        except error:
+            caught.append(j)
+        except LookupError:
+            caught.append(-1)
+        j += 1
+    return caught
+
+
+def try_abc_register_func():
+    # As in Python, registering an exception with an ABC doesn't make a clause catching the
+    # ABC catch it, whether it was registered before or after it was first raised
+    import abc
+
+    Base = abc.ABCMeta("Base", (Exception,), {})
+
+    class Early(Exception):
+        pass
+
+    class Late(Exception):
+        pass
+
+    Base.register(Early)
+    caught = []
+    for error in [Early, Late, Early, Late]:
+        try:
+            raise error()
+        except Base:
+            caught.append("base")
+        except Exception:
+            caught.append("other")
+        Base.register(Late)
+    return caught
+
+
+def try_reads_func():
+    # Only the variables assigned in the try go through its locals dict, so other variables,
+    # builtins and comprehension variables are read as they are, and assignments are seen by
+    # later reads
+    values = [1, 2, 3]
+    scale = 3
+    total = 0
+    try:
+        total = sum(v * scale for v in values)
+        doubled = [total for total in values]
+        total += len(doubled)
+        print(total, min(values))
+    except TypeError as e:
+        total = str(e)
+    return total
+
+
+def try_nested_reads_func():
+    a = 1
+    try:
+        a = a * 2
+        try:
+            a += 1
+            b = [a for a in range(a)]
+        finally:
+            a = a + len(b)
+    except KeyError:
+        a = 0
+    return a
+
+
 @pytest.mark.parametrize(
     "func",
     [
@@ -261,11 +503,35 @@ def try_exception_order_func():
         try_as_func,
         nested_try_func,
         try_exception_order_func,
+        continue_func,
+        break_func,
+        for_else_func,
+        while_break_func,
+        nested_break_func,
+        break_keeps_iterator_func,
+        try_break_func,
+        try_no_exception_func,
+        try_dispatch_func,
+        try_loop_target_func,
+        try_changing_type_func,
+        try_reads_func,
+        try_nested_reads_func,
+        try_abc_register_func,
     ],
 )
-def test_func_no_args(func):
+@pytest.mark.parametrize(
+    "options",
+    [
+        TranspileOptions(),
+        TranspileOptions(constant_memory_loops=True),
+        TranspileOptions(shared_runtime=True),
+        TranspileOptions(hoist_loop_try=True),
+    ],
+    ids=["default", "constant_memory_loops", "shared_runtime", "hoist_loop_try"],
+)
+def test_func_no_args(func, options):
     a = func()
-    b = transpiled_function_object(func, debug=True)()
+    b = transpiled_function_object(func, debug=True, options=options)()
     assert a == b, f"{a} != {b}"
 
 
@@ -274,6 +540,9 @@ def test_func_no_args(func):
     [
         raise_func,
         raise_from_func,
+        raise_class_from_func,
+        raise_from_none_func,
+        reraise_func,
     ],
 )
 def test_func_raises(func):
@@ -286,7 +555,100 @@ def test_func_raises(func):
     assert type(exc1.value) == type(exc2.value), f"{exc1} != {exc2}"
 
 
-@pytest.mark.parametrize("func, args", [(multiple_returns_func, (1, -1, 0))])
+def raise_in_closure_func(bare):
+    # The functions are defined while a KeyError is handled, but raise while an IndexError is
+    later = []
+    try:
+        {}["missing"]
+    except KeyError:
+
+        def fail():
+            raise ValueError("later")
+
+        def reraise():
+            raise
+
+        later.append(reraise if bare else fail)
+    try:
+        [][0]
+    except IndexError:
+        later[0]()
+
+
+def test_raise_in_closure():
+    with pytest.raises(ValueError) as exc:
+        transpiled_function_object(raise_in_closure_func)(False)
+    assert isinstance(exc.value.__context__, IndexError)
+    with pytest.raises(IndexError):
+        transpiled_function_object(raise_in_closure_func)(True)
+
+
+def reraise_later_func():
+    later = []
+    try:
+        {}["missing"]
+    except KeyError:
+
+        def reraise():
+            raise
+
+        later.append(reraise)
+    return later[0]
+
+
+def reraise_nothing_func():
+    raise
+
+
+def test_reraise_without_exception():
+    # Like Python, a bare raise fails when no exception is being handled
+    reraise = transpiled_function_object(reraise_later_func)()
+    with pytest.raises(RuntimeError, match="No active exception to reraise"):
+        reraise()
+    with pytest.raises(RuntimeError, match="No active exception to reraise"):
+        transpiled_function_object(reraise_nothing_func)()
+
+
+def test_raise_keeps_exception():
+    # The exception raised is the one the function made, with its attributes, cause and the
+    # traceback from where it was first raised
+    with pytest.raises(Exception) as exc:
+        transpiled_function_object(raise_custom_func)()
+    assert exc.value.code == 3 and str(exc.value) == "failed with 3"
+
+    with pytest.raises(ValueError) as exc:
+        transpiled_function_object(raise_from_none_func)()
+    assert exc.value.__cause__ is None and exc.value.__suppress_context__
+    assert isinstance(exc.value.__context__, KeyError)
+
+    with pytest.raises(ValueError) as exc:
+        transpiled_function_object(raise_from_func)()
+    assert str(exc.value.__cause__) == "second one" and exc.value.__suppress_context__
+
+    with pytest.raises(ZeroDivisionError) as exc:
+        transpiled_function_object(reraise_func)()
+    tb = exc.value.__traceback__
+    while tb.tb_next:
+        tb = tb.tb_next
+    assert tb.tb_lineno == reraise_func.__code__.co_firstlineno + 2
+
+
+def try_params_func(value, *rest, scale=2):
+    try:
+        value = int(value) * scale
+        value += len(rest)
+    except ValueError as e:
+        value = str(e)
+    return value
+
+
+@pytest.mark.parametrize(
+    "func, args",
+    [
+        (multiple_returns_func, (1, -1, 0)),
+        (try_params_func, ("4", "x", 7)),
+    ],
+)
 def test_func_args(func, args):
     for arg in args:
         a = func(arg)
@@ -294,16 +656,6 @@ def test_func_args(func, args):
         assert a == b, f"{a} != {b}"
 
 
-def continue_func():
-    for _ in range(2):
-        continue
-
-
-def break_func():
-    for _ in range(2):
-        break
-
-
 def yield_func():
     for _ in range(2):
         yield 1
@@ -314,6 +666,23 @@ def yield_from_func():
         yield from [1, 2]
 
 
+def yield_expression_func():
+    x = yield 1
+    return x
+
+
+def return_in_generator_func():
+    yield 1
+    return
+
+
+def break_in_generator_func():
+    for i in range(3):
+        if i:
+            break
+        yield i
+
+
 def del_func():
     a = 1
     del a
@@ -323,21 +692,17 @@ def pass_func():
     pass
 
 
-def async_func():
+def async_generator_func():
     async def a():
-        return 1
-
-
-def async_for_func():
-    async def a():
-        async for _ in range(2):
-            return
+        yield 1
 
 
-def async_with_func():
+def await_in_try_func():
     async def a():
-        async with True:
-            return
+        try:
+            await a()
+        except ValueError:
+            pass
 
 
 def nonlocal_func():
@@ -357,15 +722,13 @@ def global_func():
 @pytest.mark.parametrize(
     "func",
     [
-        continue_func,
-        break_func,
-        yield_func,
-        yield_from_func,
+        yield_expression_func,
+        return_in_generator_func,
+        break_in_generator_func,
         del_func,
         pass_func,
-        async_func,
-        async_for_func,
-        async_with_func,
+        async_generator_func,
+        await_in_try_func,
         nonlocal_func,
         global_func,
     ],
@@ -373,3 +736,307 @@ def global_func():
 def test_failure_funcs(func):
     with pytest.raises(ExprifyException):
         transpiled_function_object(func, debug=True)
+
+
+def generator_func():
+    total = 0
+    for x in [1, 2, 3, 4]:
+        total += x
+        if x % 2 == 0:
+            yield x
+            yield total
+        else:
+            total -= 1
+    yield from [total, -1]
+    n = 0
+    while n < 3:
+        n += 1
+        yield n
+    else:
+        yield "done"
+    yield
+
+
+def nested_generator_func():
+    def inner(k):
+        yield k
+        yield k * 2
+
+    for k in range(3):
+        yield from inner(k)
+
+
+@pytest.mark.parametrize(
+    "func",
+    [yield_func, yield_from_func, generator_func, nested_generator_func],
+)
+def test_generator_funcs(func):
+    assert list(func()) == list(transpiled_function_object(func, debug=True)())
+
+
+def count_up_func(start):
+    n = start
+    while True:
+        yield n
+        n += 1
+
+
+def test_generator_lazy():
+    # An endless generator only runs as far as it is consumed
+    transpiled = transpiled_function_object(count_up_func)
+    assert list(islice(transpiled(5), 4)) == [5, 6, 7, 8]
+
+
+def numbered_lines_func(path):
+    read = 0
+    f = open(path)
+    for line in f:
+        read += 1
+        if line.strip():
+            yield read, line.rstrip()
+    f.close()
+
+
+def test_generator_streams_file(tmp_path):
+    path = tmp_path / "lines.txt"
+    path.write_text("".join(f"line {i}\n" if i % 3 else "\n" for i in range(50000)))
+    transpiled = transpiled_function_object(numbered_lines_func)
+    assert list(islice(transpiled(path), 3)) == [
+        (2, "line 1"),
+        (3, "line 2"),
+        (5, "line 4"),
+    ]
+    # Consuming the whole file only ever holds on to the current line
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in transpiled(path))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert count == sum(1 for _ in numbered_lines_func(path))
+    assert peak < 100_000
+
+
+def long_loop_func():
+    total = 0
+    for i in range(200000):
+        total += i
+    n = 0
+    while n < 200000:
+        n += 1
+    return total + n
+
+
+def test_constant_memory_loops():
+    # Without per-iteration results, the loops shouldn't allocate anything that grows with them
+    func = transpiled_function_object(
+        long_loop_func, options=TranspileOptions(constant_memory_loops=True)
+    )
+    tracemalloc.start()
+    try:
+        assert func() == long_loop_func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 100_000
+
+
+async def async_func(delay):
+    import asyncio
+
+    async def double(x):
+        await asyncio.sleep(delay)
+        return x * 2
+
+    async def constant():
+        return 5
+
+    total = 0
+    for i in range(5):
+        total += await double(i)
+    async with asyncio.Lock(), asyncio.Semaphore(2):
+        total += 100
+    k = 0
+    while await double(k) < 6:
+        k += 1
+    else:
+        total += 1000
+    doubled = await asyncio.gather(*[double(i) for i in range(20)])
+    return total, k, sum(doubled), await constant()
+
+
+@pytest.mark.parametrize(
+    "options",
+    [TranspileOptions(), TranspileOptions(shared_runtime=True)],
+    ids=["default", "shared_runtime"],
+)
+def test_async_funcs(options):
+    assert asyncio.run(async_func(0)) == asyncio.run(
+        transpiled_function_object(async_func, options=options)(0)
+    )
+
+
+async def echo_handler_func(reader, writer):
+    import asyncio
+
+    async for line in reader:
+        if line == b"quit\n":
+            break
+        await asyncio.sleep(0.1)
+        writer.write(line.upper())
+        await writer.drain()
+    writer.write(b"bye\n")
+    writer.close()
+    await writer.wait_closed()
+
+
+async def echo_client_func(port, words):
+    import asyncio
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    replies = []
+    for word in words:
+        writer.write(word.encode() + b"\n")
+        await writer.drain()
+        replies.append((await reader.readline()).decode().strip())
+    writer.write(b"quit\nignored\n")
+    await writer.drain()
+    rest = await reader.read()
+    writer.close()
+    return replies, rest
+
+
+async def echo_server_func(handler, client, clients):
+    import asyncio
+    import time
+
+    server = await asyncio.start_server(handler, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        start = time.perf_counter()
+        replies = await asyncio.gather(*[client(port, words) for words in clients])
+        elapsed = time.perf_counter() - start
+    return replies, elapsed
+
+
+def test_async_server():
+    clients = [[f"word{i}", f"word{i + 1}"] for i in range(10)]
+    expected, _ = asyncio.run(
+        echo_server_func(echo_handler_func, echo_client_func, clients)
+    )
+    replies, elapsed = asyncio.run(
+        transpiled_function_object(echo_server_func)(
+            transpiled_function_object(echo_handler_func),
+            transpiled_function_object(echo_client_func),
+            clients,
+        )
+    )
+    assert replies == expected
+    assert replies[0] == (["WORD0", "WORD1"], b"bye\n")
+    # Each client waits 0.2s on the server, which only adds up if they ran one after another
+    assert elapsed < 1
+
+
+def fib_func(n):
+    if n < 2:
+        return n
+    else:
+        return fib_func(n - 1) + fib_func(n - 2)
+
+
+def test_exprified():
+    for func in (basic_func, class_func, readme_example_func, recursive_func):
+        assert exprified(func)() == func()
+    fib = exprified(fib_func)
+    assert fib(15) == fib_func(15)
+    # The function is compiled once, and shared with later decorations of the same code
+    hits = transpile_module.exprified_code.cache_info().hits
+    assert exprified(fib_func)(10) == fib_func(10)
+    assert transpile_module.exprified_code.cache_info().hits == hits + 1
+    assert fib.__name__ == "fib_func"
+
+
+def test_exprified_lazy():
+    # Nothing is transpiled until the function is first called
+    func = exprified(pass_func)
+    with pytest.raises(ExprifyException):
+        func()
+    # Variables of an enclosing function can't be reached from the transpiled function
+    n = 1
+
+    def closure():
+        return n
+
+    with pytest.raises(ExprifyException):
+        exprified(closure)
+
+
+EXPRIFIED_MODULE = """
+from exprify import exprified
+
+OFFSET = 1
+
+
+@exprified(persist=True)
+def total(values):
+    t = OFFSET
+    for v in values:
+        t += v
+    return t
+"""
+
+
+def test_exprified_persist(tmp_path, monkeypatch):
+    monkeypatch.delenv(cache.CACHE_DISABLE_ENV, raising=False)
+    path = tmp_path / "exprified_module.py"
+    path.write_text(EXPRIFIED_MODULE)
+
+    def load():
+        spec = importlib.util.spec_from_file_location("exprified_module", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    module = load()
+    assert module.total([1, 2]) == 4
+    # The module's globals are looked up as they are, and the injections stay out of them
+    module.OFFSET = 10
+    assert module.total([1, 2]) == 13
+    assert "gC" not in vars(module)
+    assert len(list((tmp_path / "__pycache__").glob("*" + cache.CODE_SUFFIX))) == 1
+
+    # A fresh process would load the compiled function instead of transpiling it again
+    transpile_module.exprified_code.cache_clear()
+    monkeypatch.setattr(transpile_module, "transpile", None)
+    assert load().total([1, 2]) == 4
+
+
+def test_exprified_code_per_file(tmp_path):
+    # Code objects compare equal to the same code from another file, which must still be
+    # compiled with its own filename
+    codes = []
+    for name in ("a.py", "b.py"):
+        path = tmp_path / name
+        path.write_text("def increment(v):\n    return v + 1\n")
+        codes.append(compile(path.read_text(), str(path), "exec").co_consts[0])
+    assert codes[0] == codes[1]
+    compiled = [transpile_module.exprified_code(c, c.co_filename) for c in codes]
+    assert [c.co_filename for c in compiled] == [c.co_filename for c in codes]
+
+
+def divide_func(values):
+    total = 0
+    for value in values:
+        total += 10 / value
+    return total
+
+
+def test_transpiled_locations():
+    # The compiled function keeps the file and line numbers of the original
+    with pytest.raises(ZeroDivisionError) as exc:
+        transpiled_function_object(divide_func)([1, 0])
+    tb = exc.value.__traceback__
+    while tb.tb_next:
+        tb = tb.tb_next
+    assert tb.tb_frame.f_code.co_filename == __file__
+    assert tb.tb_lineno == divide_func.__code__.co_firstlineno + 3
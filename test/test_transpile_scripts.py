@@ -1,7 +1,12 @@
+import ast
 import pytest
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-from exprify import transpiled_script
+from exprify import reflow, transpiled_script, transpile_script_source, TranspileOptions
+from exprify.ast_transformer import ExprifyException
+from exprify.emitter import emit_source
+from exprify.transpile import transpile, transpiled_code
 from .utils import exec_with_output
 
 SCRIPTS_PATH = "test_scripts"
@@ -19,3 +24,124 @@ def test_transform_scripts(filename):
     assert exec_with_output(open(filename).read()) == exec_with_output(
         transpiled_script(filename)
     )
+
+
+@pytest.mark.parametrize(
+    "filename",
+    [
+        os.path.join(SCRIPTS_PATH, i)
+        for i in os.listdir(SCRIPTS_PATH)
+        if i.endswith(".py")
+    ],
+)
+def test_emit_source_round_trip(filename):
+    # emit_source must produce the same program as ast.unparse, just more compactly
+    tree = transpile(open(filename).read())
+    emitted = emit_source(tree)
+    assert ast.dump(ast.parse(emitted)) == ast.dump(ast.parse(ast.unparse(tree)))
+    assert len(emitted) < len(ast.unparse(tree))
+
+
+@pytest.mark.parametrize(
+    "filename",
+    [
+        os.path.join(SCRIPTS_PATH, i)
+        for i in os.listdir(SCRIPTS_PATH)
+        if i.endswith(".py")
+    ],
+)
+def test_transpiled_code(filename):
+    # Compiling the transpiled AST directly runs the same as the script
+    source = open(filename).read()
+    assert exec_with_output(transpiled_code(source, filename)) == exec_with_output(
+        source
+    )
+
+
+def test_transpile_threads():
+    # Transpiles share no state, so they can run concurrently, and the same source always
+    # transpiles to the same output
+    sources = [
+        open(os.path.join(SCRIPTS_PATH, i)).read()
+        for i in sorted(os.listdir(SCRIPTS_PATH))
+        if i.endswith(".py")
+    ]
+    expected = [emit_source(transpile(source)) for source in sources]
+    with ThreadPoolExecutor(8) as pool:
+        outputs = list(
+            pool.map(lambda source: emit_source(transpile(source)), sources * 8)
+        )
+    assert outputs == expected * 8
+
+
+RUNTIME_SCRIPT = """
+def add(a, b):
+    try:
+        a + b
+    except TypeError:
+        a = 0
+    return a
+
+
+def fail(value):
+    raise ValueError(value)
+
+
+print(add("x", 2))
+"""
+
+
+def test_shared_runtime():
+    # The helpers are imported from exprify.runtime instead of being defined by the script
+    shared = transpile_script_source(
+        RUNTIME_SCRIPT, TranspileOptions(shared_runtime=True)
+    )
+    assert "__import__('exprify.runtime')" in shared
+    assert "type('iEH'" not in shared and "rH:=lambda" not in shared
+    assert "type('iEH'" in transpile_script_source(RUNTIME_SCRIPT)
+    assert exec_with_output(shared) == exec_with_output(RUNTIME_SCRIPT) == "0\n"
+
+
+TRY_LOCALS_SCRIPT = """
+def count(items, limit):
+    seen = 0
+    skipped = 0
+    for item in items:
+        try:
+            seen = seen + len(item[:limit])
+        except TypeError:
+            skipped += 1
+    return seen, skipped
+
+
+print(count(["ab", None, "cde"], 2))
+"""
+
+
+def test_try_locals():
+    # Only the variables the try assigns are copied into its locals dict and back
+    transpiled = transpile_script_source(TRY_LOCALS_SCRIPT)
+    assert "dict(seen=seen,skipped=skipped)" in transpiled
+    assert "item=" not in transpiled and "limit=" not in transpiled
+    assert "len(item[:limit])" in transpiled
+    assert exec_with_output(transpiled) == exec_with_output(TRY_LOCALS_SCRIPT)
+
+
+MATCH_SCRIPT = """
+x = (2, 3)
+match x:
+    case 1:
+        print("one")
+    case (a, b):
+        print(a + b)
+    case _:
+        print("something else")
+"""
+
+
+def test_top_level_match():
+    # A statement that is left as it is keeps its newlines and indentation
+    transpiled = transpile_script_source(MATCH_SCRIPT)
+    assert exec_with_output(transpiled) == exec_with_output(MATCH_SCRIPT)
+    with pytest.raises(ExprifyException):
+        reflow(MATCH_SCRIPT, "8" * 40 + "\n" * 40)